@@ -1,14 +1,32 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response, send_file, g, has_app_context, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 import functools
-import pandas as pd
+import hmac
+import importlib
 import os
 import sys
-from datetime import datetime
+import atexit
+import threading
+import weakref
+from datetime import datetime, timedelta
 import sqlite3
-import json
+import tempfile
+import time
 from io import BytesIO
-from xhtml2pdf import pisa
+from day_summary import build_day_summary
+from pdf_exports import PdfExportQueue, content_key
+from backups import BackupManager
+from metrics import RequestMetrics, TimedCursor, set_statement_observer, start_sql_timer, sql_time
+from query_log import SlowQueryLog
+from catalogs import (create_catalog_schema, catalog_version, list_stylists, list_services, list_sedes, list_users,
+                      list_service_categories, categorize_service, categorize_new_services,
+                      DEMAND_CATEGORIES, SERVICE_CATEGORIES)
+from serialization import column_names, row_to_dict, rows_to_dicts, iter_json_rows
+from exports import (EXPORT_TABLES, EXPORT_FORMATS, parse_range, export_query, export_filename, write_xlsx,
+                     FileBody, remove_file)
+from result_cache import ResultCache, create_data_version_schema, data_version, total_data_version
+from forecasting import create_forecast_schema, forecast, income_history, refresh_forecast_state
+from rollups import create_rollup_schema, month_bounds, month_totals, month_by_stylist, sales_timeline, sales_by_day
 
 app = Flask(__name__)
 app.secret_key = 'magical_hair_secret_key_change_this_in_production'  # Required for session
@@ -30,6 +48,114 @@ SERVICES_FILE = os.path.join(APP_DIR, 'services.json')
 SEDES_FILE    = os.path.join(APP_DIR, 'sedes.json')
 USERS_FILE    = os.path.join(APP_DIR, 'users.json')
 
+# Ajustes de SQLite (se pueden sobreescribir con variables de entorno)
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_CACHE_SIZE_KB   = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '8192'))
+SQLITE_MMAP_SIZE       = int(os.environ.get('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024)))
+
+# PDFs ya generados (cierres del día) y número de hilos que los generan
+PDF_CACHE_DIR      = os.path.join(APP_DIR, 'pdf_cache')
+PDF_EXPORT_WORKERS = int(os.environ.get('PDF_EXPORT_WORKERS', '2'))
+
+# Resultados de analítica guardados en memoria (predicción, patrones, demanda)
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', '256'))
+
+# /api/prediction only reads forecast_state; a background thread stores it up to date
+# at startup and then every FORECAST_REFRESH_MINUTES (0 = only at startup)
+FORECAST_REFRESH_MINUTES = float(os.environ.get('FORECAST_REFRESH_MINUTES', '30'))
+
+# Heavy modules are imported on first use (PDFs, analytics) so the login page
+# does not wait for them; the warmup thread loads them early unless disabled
+HEAVY_MODULES = ('xhtml2pdf.pisa', 'numpy')
+PREWARM_IMPORTS = os.environ.get('PREWARM_IMPORTS', '1') != '0'
+
+# Respaldos automáticos en Backup/ (BACKUP_INTERVAL_HOURS=0 los desactiva)
+BACKUP_DIR              = os.path.join(APP_DIR, 'Backup')
+BACKUP_INTERVAL_HOURS   = float(os.environ.get('BACKUP_INTERVAL_HOURS', '24'))
+BACKUP_PAGES_PER_STEP   = int(os.environ.get('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_PAUSE_MS    = int(os.environ.get('BACKUP_STEP_PAUSE_MS', '10'))
+BACKUP_KEEP_DAILY       = int(os.environ.get('BACKUP_KEEP_DAILY', '7'))
+BACKUP_KEEP_WEEKLY      = int(os.environ.get('BACKUP_KEEP_WEEKLY', '4'))
+BACKUP_KEEP_MONTHLY     = int(os.environ.get('BACKUP_KEEP_MONTHLY', '12'))
+
+# Consultas más lentas que SLOW_QUERY_MS se registran (con su EXPLAIN QUERY PLAN) en logs/slow_queries.log
+QUERY_TRACING           = os.environ.get('QUERY_TRACING', '1') != '0'
+SLOW_QUERY_MS           = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG          = os.path.join(APP_DIR, 'logs', 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_KB   = int(os.environ.get('SLOW_QUERY_LOG_MAX_KB', '1024'))
+SLOW_QUERY_LOG_BACKUPS  = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', '5'))
+
+# Token for Prometheus at /api/metrics (Authorization: Bearer <token>); without it only logged-in users
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+pdf_exports = PdfExportQueue(PDF_CACHE_DIR, workers=PDF_EXPORT_WORKERS)
+analytics_cache = ResultCache(maxsize=ANALYTICS_CACHE_SIZE)
+# Row totals of the admin panel per (table, filters), valid until the next write
+admin_count_cache = ResultCache(maxsize=ANALYTICS_CACHE_SIZE)
+backup_manager = BackupManager(DB_FILE, BACKUP_DIR, interval_hours=BACKUP_INTERVAL_HOURS,
+                               pages=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE_MS / 1000,
+                               daily=BACKUP_KEEP_DAILY, weekly=BACKUP_KEEP_WEEKLY, monthly=BACKUP_KEEP_MONTHLY)
+request_metrics = RequestMetrics()
+slow_query_log = SlowQueryLog(SLOW_QUERY_LOG, threshold_ms=SLOW_QUERY_MS,
+                              max_bytes=SLOW_QUERY_LOG_MAX_KB * 1024, backups=SLOW_QUERY_LOG_BACKUPS)
+if QUERY_TRACING:
+    set_statement_observer(slow_query_log.record)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    start_sql_timer()
+    request_metrics.request_started()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    method = request.method
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = str(response.status_code)
+
+    def finish(size):
+        sql_seconds, sql_queries = sql_time()
+        request_metrics.observe(method, route, status, time.perf_counter() - start, size, sql_seconds, sql_queries)
+
+    if response.content_length is not None or not response.is_streamed:
+        finish(response.content_length or 0)
+    else:
+        # Streamed bodies (exports, admin listings) are timed until their last chunk
+        response.response = _CountedBody(response.response, finish)
+    return response
+
+class _CountedBody:
+    """Streamed body that reports its size once closed.
+
+    The WSGI server closes the body when it is done with it, also when it was
+    never iterated (HEAD requests, clients gone before the first chunk), so
+    every request started is observed exactly once.
+    """
+
+    def __init__(self, chunks, finish):
+        self.chunks = chunks
+        self.finish = finish
+        self.size = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield chunk
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+        finally:
+            self.finish(self.size)
+
 @app.errorhandler(500)
 def internal_error(error):
     if request.path.startswith('/api/'):
@@ -52,23 +178,67 @@ def login_required(view):
         return view(**kwargs)
     return wrapped_view
 
-def get_users():
-    try:
-        if not os.path.exists(USERS_FILE):
-            # Create default admin user
-            default_users = {
-                'admin': generate_password_hash('admin')
-            }
-            save_users(default_users)
-            return default_users
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
+def cached_by_data_version(view):
+    """Serve a GET analytics view from analytics_cache until the sede's data changes.
+
+    The key holds the endpoint, its query parameters, today's date (the views
+    use "last N days" windows), the sede's data_versions counter and the
+    service categories version (edited by hand, read by /api/service-demand).
+    """
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        sede = request.args.get('sede', 'Principal')
+        conn = get_db_connection()
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))),
+               datetime.now().strftime('%Y-%m-%d'), data_version(conn, sede),
+               catalog_version(conn, 'servicio_categorias'))
+        conn.close()
 
-def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+        body = analytics_cache.get(key)
+        if body is not None:
+            return app.response_class(body, mimetype='application/json')
+
+        response = make_response(view(**kwargs))
+        if response.status_code == 200:
+            analytics_cache.put(key, response.get_data())
+        return response
+    return wrapped_view
+
+class ConfigCache:
+    """Catalog kept in memory and reloaded only when its catalog_versions counter changes.
+
+    `index` builds an optional lookup structure that is refreshed together with the value.
+    """
+
+    def __init__(self, table, load, index=None):
+        self.table = table
+        self._load = load
+        self._index = index
+        self._lock = threading.RLock()
+        self._signature = None
+        self._value = None
+        self._lookup = None
+
+    def get(self):
+        conn = get_db_connection()
+        signature = catalog_version(conn, self.table)
+        with self._lock:
+            if signature != self._signature:
+                self._value = self._load(conn)
+                self._lookup = self._index(self._value) if self._index else None
+                self._signature = signature
+            return self._value
+
+    def lookup(self):
+        with self._lock:
+            self.get()
+            return self._lookup
+
+
+_users_cache = ConfigCache('usuarios', list_users)
+
+def get_users():
+    return dict(_users_cache.get())
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -110,12 +280,9 @@ def add_user():
     if not username or not password:
         return jsonify({'status': 'error', 'message': 'Usuario y contraseña requeridos'})
         
-    users = get_users()
-    if username in users:
+    if not execute_catalog_write('INSERT INTO usuarios (username, password_hash) VALUES (?, ?) ON CONFLICT (username) DO NOTHING',
+                                 (username, generate_password_hash(password))):
         return jsonify({'status': 'error', 'message': 'El usuario ya existe'})
-        
-    users[username] = generate_password_hash(password)
-    save_users(users)
     return jsonify({'status': 'success', 'message': 'Usuario creado'})
 
 @app.route('/api/users', methods=['DELETE'])
@@ -130,24 +297,96 @@ def delete_user():
     if username == session.get('user_id'):
         return jsonify({'status': 'error', 'message': 'No puedes eliminar tu propio usuario'})
         
-    users = get_users()
-    if username in users:
-        del users[username]
-        save_users(users)
+    if execute_catalog_write('DELETE FROM usuarios WHERE username = ?', (username,)):
         return jsonify({'status': 'success', 'message': 'Usuario eliminado'})
         
     return jsonify({'status': 'error', 'message': 'Usuario no encontrado'})
 
 
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+class PooledConnection(sqlite3.Connection):
+    """Long-lived per-thread connection. close() only releases it for reuse."""
+
+    def close(self):
+        # Handlers call conn.close() when done; discard anything left uncommitted
+        # (same outcome as a real close) but keep the connection open.
+        if self.in_transaction:
+            self.rollback()
+
+    def cursor(self, factory=TimedCursor):
+        # Every query is timed for the request metrics and the slow-query log
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts would bypass cursor() and use a plain cursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def dispose(self):
+        super().close()
+
+
+_db_local = threading.local()
+_db_connections = weakref.WeakSet()
+_db_connections_lock = threading.Lock()
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def _open_db_connection():
+    conn = sqlite3.connect(DB_FILE, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                           factory=PooledConnection, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    # WAL lets readers run alongside the single writer instead of blocking on it
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    with _db_connections_lock:
+        _db_connections.add(conn)
+    global _schema_ready
+    if not _schema_ready:
+        # gunicorn never calls init_db(); make sure the schema upgrade runs once,
+        # and that the other threads' first requests wait until it is committed
+        with _schema_lock:
+            if not _schema_ready:
+                create_schema(conn)
+                _schema_ready = True
     return conn
 
-def init_db():
-    """Initialize the SQLite database if it doesn't exist."""
-    conn = get_db_connection()
+def get_db_connection():
+    """Return this thread's SQLite connection, opening it on first use."""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = _open_db_connection()
+        _db_local.conn = conn
+    if has_app_context():
+        g.db = conn
+    return conn
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
+
+@atexit.register
+def close_db_connections():
+    """Really close every pooled connection (checkpoints the WAL on exit)."""
+    with _db_connections_lock:
+        connections = list(_db_connections)
+        _db_connections.clear()
+    for conn in connections:
+        try:
+            conn.dispose()
+        except sqlite3.Error:
+            pass
+    _db_local.__dict__.pop('conn', None)
+
+def create_schema(conn):
+    """Create missing tables and indexes. Safe to run on every startup."""
     c = conn.cursor()
     
     # Servicios
@@ -223,59 +462,81 @@ def init_db():
                     valor REAL,
                     fecha_registro TIMESTAMP
                 );''')
-    
+
+    # Indexes: date filters are written as fecha >= day AND fecha < next_day
+    # so these can be used for seeks instead of full scans
+    c.execute('CREATE INDEX IF NOT EXISTS idx_servicios_sede_fecha ON servicios (sede, fecha)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_productos_sede_fecha ON productos (sede, fecha)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_gastos_sede_fecha ON gastos (sede, fecha)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_citas_sede_fecha ON citas (sede, fecha)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_citas_fecha ON citas (fecha)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_gastos_mensuales_sede_mes_tipo ON gastos_mensuales (sede, mes, tipo)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_inventario_sede_producto ON inventario (sede, producto)')
+
     conn.commit()
+
+    # Pre-summed daily totals, maintained by triggers (see rollups.py)
+    create_rollup_schema(conn)
+
+    # Incremental regression state for /api/prediction (see forecasting.py)
+    create_forecast_schema(conn)
+
+    # Per-sede write counters used to invalidate cached analytics
+    create_data_version_schema(conn)
+
+    # Stylists, services, sedes and users (imported once from the JSON files)
+    create_catalog_schema(conn, STYLISTS_FILE, SERVICES_FILE, SEDES_FILE, USERS_FILE)
+    c.execute('SELECT 1 FROM usuarios LIMIT 1')
+    if c.fetchone() is None:
+        # Create default admin user
+        c.execute('INSERT OR IGNORE INTO usuarios (username, password_hash) VALUES (?, ?)',
+                  ('admin', generate_password_hash('admin')))
+        conn.commit()
+
+def init_db():
+    """Initialize the SQLite database if it doesn't exist."""
+    conn = get_db_connection()
+    create_schema(conn)
     conn.close()
     print(f"Database {DB_FILE} initialized.")
 
+def day_bounds(day):
+    """Return the half-open range [day, next_day) for a 'YYYY-MM-DD' string."""
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return start.strftime('%Y-%m-%d'), (start + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def _index_stylists(stylists):
+    """Lower-cased stylist name -> (commission rate, special commission rate)."""
+    rates = {}
+    for s in stylists:
+        rates.setdefault(s['name'].lower(), (
+            float(s.get('commission', 50)) / 100,
+            float(s.get('special_commission', 50)) / 100
+        ))
+    return rates
+
+_stylists_cache = ConfigCache('estilistas', list_stylists, index=_index_stylists)
+_services_cache = ConfigCache('catalogo_servicios', list_services)
+_sedes_cache = ConfigCache('sedes', list_sedes)
+_service_categories_cache = ConfigCache('servicio_categorias', list_service_categories)
 
 def get_stylists():
-    try:
-        with open(STYLISTS_FILE, 'r') as f:
-            data = json.load(f)
-            # Migration: if list of strings, convert to objects with default commission
-            if data and isinstance(data[0], str):
-                new_data = [{'name': s, 'commission': 50, 'special_commission': 50} for s in data]
-                save_stylists(new_data)
-                return new_data
-            return data
-    except:
-        return []
-
-def save_stylists(stylists):
-    with open(STYLISTS_FILE, 'w') as f:
-        json.dump(stylists, f, indent=2)
+    return [dict(s) for s in _stylists_cache.get()]
+
+def get_stylist_rates():
+    return _stylists_cache.lookup()
 
 def get_services():
-    try:
-        with open(SERVICES_FILE, 'r') as f:
-            data = json.load(f)
-            # Migration check: if list of strings, convert to objects
-            if data and isinstance(data[0], str):
-                new_data = [{'name': s, 'value': 0} for s in data]
-                save_services(new_data)
-                return new_data
-            return data
-    except:
-        return []
-
-def save_services(services):
-    with open(SERVICES_FILE, 'w') as f:
-        json.dump(services, f)
+    categories = get_service_categories()
+    return [dict(s, category=categories.get(s['name']) or categorize_service(s['name']))
+            for s in _services_cache.get()]
+
+def get_service_categories():
+    return dict(_service_categories_cache.get())
 
 def get_sedes():
-    try:
-        with open(SEDES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        # Return default sede if file doesn't exist
-        default = ['Principal']
-        save_sedes(default)
-        return default
-
-def save_sedes(sedes):
-    with open(SEDES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(sedes, f, ensure_ascii=False, indent=2)
+    return list(_sedes_cache.get())
 
 def insert_record(table, data):
     """Insert a record into the specified SQLite table."""
@@ -291,6 +552,8 @@ def insert_record(table, data):
         sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
         
         c.execute(sql, list(data.values()))
+        if table == 'servicios' and data.get('servicio'):
+            categorize_new_services(conn, [data['servicio']])
         conn.commit()
         conn.close()
         return True
@@ -321,26 +584,98 @@ def admin_panel():
     services = get_services()
     return render_template('admin.html', stylists=stylist_names, sedes=sedes, services=services)
 
-@app.route('/certificado/descargar')
-@login_required
-def download_certificate_pdf():
-    try:
-        context = {
-            'date': datetime.now().strftime('%d de %B de %Y'),
-            'generation_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
+_certificate_pdf = {}  # 'YYYY-MM-DD' -> PDF bytes (only today's entry is kept)
+_certificate_lock = threading.Lock()
+
+def certificate_pdf():
+    """Today's certificate PDF. Rendered at most once per calendar day (memory, then pdf_cache/)."""
+    now = datetime.now()
+    day = now.strftime('%Y-%m-%d')
+    with _certificate_lock:
+        pdf = _certificate_pdf.get(day)
+        if pdf:
+            return pdf
+
         # Translate month names if possible or use simple format
         months = {
             'January': 'Enero', 'February': 'Febrero', 'March': 'Marzo', 'April': 'Abril',
             'May': 'Mayo', 'June': 'Junio', 'July': 'Julio', 'August': 'Agosto',
             'September': 'Septiembre', 'October': 'Octubre', 'November': 'Noviembre', 'December': 'Diciembre'
         }
-        now = datetime.now()
         date_str = f"{now.day} de {months.get(now.strftime('%B'), now.strftime('%B'))} de {now.year}"
-        context['date'] = date_str
 
-        pdf = render_pdf('certificado_pdf.html', context)
+        # Only the date is printed, so it alone (with the template) identifies the file
+        key = content_key(template_source('certificado_pdf.html'), {'date': date_str})
+        path = pdf_exports.lookup(key)
+        if path:
+            with open(path, 'rb') as f:
+                pdf = f.read()
+        else:
+            context = {
+                'date': date_str,
+                'generation_time': now.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            with app.app_context():
+                pdf = render_pdf('certificado_pdf.html', context)
+            if not pdf:
+                return None
+            pdf_exports.store(key, pdf)
+
+        _certificate_pdf.clear()
+        _certificate_pdf[day] = pdf
+        return pdf
+
+_warmup_started = False
+_warmup_lock = threading.Lock()
+
+def start_background_warmup():
+    """Start the background work once per process: warmup, forecast refresher and backup scheduler."""
+    global _warmup_started
+    if _warmup_started:
+        return
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=_warmup, name='warmup', daemon=True).start()
+    threading.Thread(target=_refresh_forecasts, name='forecast-refresh', daemon=True).start()
+    backup_manager.start()
+
+def _refresh_forecasts():
+    # Closed days and edits of past days are folded into forecast_state here, off the request path
+    while True:
+        try:
+            conn = get_db_connection()
+            refresh_forecast_state(conn, datetime.now().date())
+            conn.close()
+        except Exception as e:
+            print(f"Error actualizando el estado de la predicción: {e}")
+        if FORECAST_REFRESH_MINUTES <= 0:
+            return
+        time.sleep(FORECAST_REFRESH_MINUTES * 60)
+
+def _warmup():
+    if PREWARM_IMPORTS:
+        for module in HEAVY_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                print(f"Error pre-loading {module}: {e}")
+    try:
+        certificate_pdf()
+    except Exception as e:
+        print(f"Error warming up certificate PDF: {e}")
+
+@app.before_request
+def warmup_on_first_request():
+    # gunicorn never runs the __main__ block, so the first request starts the warmup
+    start_background_warmup()
+
+@app.route('/certificado/descargar')
+@login_required
+def download_certificate_pdf():
+    try:
+        pdf = certificate_pdf()
         if pdf:
             response = make_response(pdf)
             response.headers['Content-Type'] = 'application/pdf'
@@ -360,6 +695,16 @@ def get_stylists_list():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def execute_catalog_write(sql, params):
+    """Run a single-row catalog statement and return the number of rows changed."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(sql, params)
+    conn.commit()
+    changed = c.rowcount
+    conn.close()
+    return changed
+
 @app.route('/api/stylist', methods=['POST'])
 @login_required
 def add_stylist():
@@ -368,14 +713,9 @@ def add_stylist():
     commission = float(data.get('commission', 50))
     special_commission = float(data.get('special_commission', 50))
     if new_stylist:
-        stylists = get_stylists()
-        if not any(s['name'] == new_stylist for s in stylists):
-            stylists.append({
-                'name': new_stylist,
-                'commission': commission,
-                'special_commission': special_commission
-            })
-            save_stylists(stylists)
+        if execute_catalog_write('''INSERT INTO estilistas (nombre, comision, comision_especial) VALUES (?, ?, ?)
+                                    ON CONFLICT (nombre) DO NOTHING''',
+                                 (new_stylist, commission, special_commission)):
             return jsonify({'status': 'success', 'message': 'Estilista agregado'})
         return jsonify({'status': 'error', 'message': 'El estilista ya existe'})
     return jsonify({'status': 'error', 'message': 'Nombre inválido'})
@@ -389,15 +729,13 @@ def update_stylist():
     special_commission = data.get('special_commission')
     
     if name:
-        stylists = get_stylists()
-        for stylist in stylists:
-            if stylist['name'] == name:
-                if commission is not None:
-                    stylist['commission'] = float(commission)
-                if special_commission is not None:
-                    stylist['special_commission'] = float(special_commission)
-                save_stylists(stylists)
-                return jsonify({'status': 'success', 'message': 'Estilista actualizado'})
+        if execute_catalog_write('''UPDATE estilistas
+                                    SET comision = IFNULL(?, comision), comision_especial = IFNULL(?, comision_especial)
+                                    WHERE nombre = ?''',
+                                 (float(commission) if commission is not None else None,
+                                  float(special_commission) if special_commission is not None else None,
+                                  name)):
+            return jsonify({'status': 'success', 'message': 'Estilista actualizado'})
         return jsonify({'status': 'error', 'message': 'Estilista no encontrado'})
     return jsonify({'status': 'error', 'message': 'Nombre inválido'})
 
@@ -406,12 +744,8 @@ def update_stylist():
 def delete_stylist():
     data = request.json
     name_to_delete = data.get('name')
-    stylists = get_stylists()
-    for i, s in enumerate(stylists):
-        if s['name'] == name_to_delete:
-            stylists.pop(i)
-            save_stylists(stylists)
-            return jsonify({'status': 'success', 'message': 'Estilista eliminado'})
+    if execute_catalog_write('DELETE FROM estilistas WHERE nombre = ?', (name_to_delete,)):
+        return jsonify({'status': 'success', 'message': 'Estilista eliminado'})
     return jsonify({'status': 'error', 'message': 'Estilista no encontrado'})
 
 @app.route('/api/service-item', methods=['POST'])
@@ -422,11 +756,9 @@ def add_service_item():
     new_service_value = float(data.get('value', 0))
     
     if new_service_name:
-        services = get_services()
-        # Check if exists by name
-        if not any(s['name'] == new_service_name for s in services):
-            services.append({'name': new_service_name, 'value': new_service_value})
-            save_services(services)
+        if execute_catalog_write('''INSERT INTO catalogo_servicios (nombre, valor) VALUES (?, ?)
+                                    ON CONFLICT (nombre) DO NOTHING''',
+                                 (new_service_name, new_service_value)):
             return jsonify({'status': 'success', 'message': 'Servicio agregado'})
         return jsonify({'status': 'error', 'message': 'El servicio ya existe'})
     return jsonify({'status': 'error', 'message': 'Nombre inválido'})
@@ -448,13 +780,9 @@ def update_service_item():
     value = data.get('value')
     
     if name:
-        services = get_services()
-        for service in services:
-            if service['name'] == name:
-                if value is not None:
-                    service['value'] = float(value)
-                save_services(services)
-                return jsonify({'status': 'success', 'message': 'Servicio actualizado'})
+        if execute_catalog_write('UPDATE catalogo_servicios SET valor = IFNULL(?, valor) WHERE nombre = ?',
+                                 (float(value) if value is not None else None, name)):
+            return jsonify({'status': 'success', 'message': 'Servicio actualizado'})
         return jsonify({'status': 'error', 'message': 'Servicio no encontrado'})
     return jsonify({'status': 'error', 'message': 'Nombre inválido'})
 
@@ -463,16 +791,31 @@ def update_service_item():
 def delete_service_item():
     data = request.json
     name_to_delete = data.get('name')
-    services = get_services()
-    
-    # Filter out the service with the given name
-    new_services = [s for s in services if s['name'] != name_to_delete]
-    
-    if len(new_services) < len(services):
-        save_services(new_services)
+    if execute_catalog_write('DELETE FROM catalogo_servicios WHERE nombre = ?', (name_to_delete,)):
         return jsonify({'status': 'success', 'message': 'Servicio eliminado'})
     return jsonify({'status': 'error', 'message': 'Servicio no encontrado'})
 
+@app.route('/api/service-categories', methods=['GET'])
+@login_required
+def get_service_categories_api():
+    return jsonify({'status': 'success', 'data': get_service_categories(), 'categories': SERVICE_CATEGORIES})
+
+@app.route('/api/service-category', methods=['PUT'])
+@login_required
+def update_service_category():
+    data = request.json
+    name = data.get('name')
+    category = data.get('category')
+
+    if not name:
+        return jsonify({'status': 'error', 'message': 'Nombre inválido'})
+    if category not in SERVICE_CATEGORIES:
+        return jsonify({'status': 'error', 'message': 'Categoría inválida'})
+    execute_catalog_write('''INSERT INTO servicio_categorias (servicio, categoria) VALUES (?, ?)
+                             ON CONFLICT (servicio) DO UPDATE SET categoria = excluded.categoria''',
+                          (name, category))
+    return jsonify({'status': 'success', 'message': 'Categoría actualizada'})
+
 @app.route('/api/sedes', methods=['GET'])
 @login_required
 def get_sedes_api():
@@ -485,10 +828,7 @@ def add_sede():
     data = request.json
     new_sede = data.get('name')
     if new_sede:
-        sedes = get_sedes()
-        if new_sede not in sedes:
-            sedes.append(new_sede)
-            save_sedes(sedes)
+        if execute_catalog_write('INSERT INTO sedes (nombre) VALUES (?) ON CONFLICT (nombre) DO NOTHING', (new_sede,)):
             return jsonify({'status': 'success', 'message': 'Sede agregada'})
         return jsonify({'status': 'error', 'message': 'La sede ya existe'})
     return jsonify({'status': 'error', 'message': 'Nombre inválido'})
@@ -498,12 +838,11 @@ def add_sede():
 def delete_sede():
     data = request.json
     name_to_delete = data.get('name')
-    sedes = get_sedes()
-    if len(sedes) <= 1:
+    if len(get_sedes()) <= 1:
         return jsonify({'status': 'error', 'message': 'No se puede eliminar la última sede'})
-    if name_to_delete in sedes:
-        sedes.remove(name_to_delete)
-        save_sedes(sedes)
+    # Count is re-checked in SQL so two concurrent deletes cannot remove the last sede
+    if execute_catalog_write('DELETE FROM sedes WHERE nombre = ? AND (SELECT COUNT(*) FROM sedes) > 1',
+                             (name_to_delete,)):
         return jsonify({'status': 'success', 'message': 'Sede eliminada'})
     return jsonify({'status': 'error', 'message': 'Sede no encontrada'})
 
@@ -512,15 +851,11 @@ def calculate_commission(stylist, service, value):
     is_special_service = 'tinte' in service_lower or 'mechas' in service_lower or 'keratina' in service_lower
     
     # Get stylist commission from config
-    stylists = get_stylists()
-    stylist_config = next((s for s in stylists if s['name'].lower() == stylist.lower()), None)
+    rates = get_stylist_rates().get(stylist.lower())
     
-    if stylist_config:
-        if is_special_service:
-            commission_rate = float(stylist_config.get('special_commission', 50)) / 100
-        else:
-            commission_rate = float(stylist_config.get('commission', 50)) / 100
-        return value * commission_rate
+    if rates:
+        commission_rate, special_commission_rate = rates
+        return value * (special_commission_rate if is_special_service else commission_rate)
     
     # Default for others
     return value * 0.50
@@ -551,6 +886,17 @@ def add_service():
         return jsonify({'status': 'success', 'message': 'Servicio registrado', 'comision': comision})
     return jsonify({'status': 'error', 'message': 'Error al guardar'}), 500
 
+# Takes one unit of the product's first inventory row at the sede (if it has stock)
+DECREMENT_INVENTORY_SQL = '''UPDATE inventario
+                             SET cantidad = cantidad - 1,
+                                 estado = CASE WHEN cantidad - 1 > 0 THEN 'Nuevo' ELSE 'Agotado' END
+                             WHERE id = (SELECT id FROM inventario WHERE producto = ? AND sede = ? ORDER BY id LIMIT 1)
+                               AND cantidad > 0'''
+
+def decrement_inventory(c, sede, productos):
+    """Discount one unit per sold product. The caller commits."""
+    c.executemany(DECREMENT_INVENTORY_SQL, [(producto, sede) for producto in productos])
+
 @app.route('/api/product', methods=['POST'])
 @login_required
 def add_product():
@@ -578,19 +924,8 @@ def add_product():
         try:
             conn = get_db_connection()
             c = conn.cursor()
-            
-            # Use lowercase for column names
-            # Find matching product in inventory at the same sede
-            c.execute('SELECT id, cantidad FROM inventario WHERE producto = ? AND sede = ?', (data['producto'], sede))
-            row = c.fetchone()
-            
-            if row:
-                current_qty = float(row['cantidad'])
-                if current_qty > 0:
-                    new_qty = current_qty - 1
-                    status = 'Nuevo' if new_qty > 0 else 'Agotado'
-                    c.execute('UPDATE inventario SET cantidad = ?, estado = ? WHERE id = ?', (new_qty, status, row['id']))
-                    conn.commit()
+            decrement_inventory(c, sede, [data['producto']])
+            conn.commit()
             conn.close()
         except Exception as e:
             print(f"Error updating inventory: {e}")
@@ -614,19 +949,74 @@ def add_expense():
         return jsonify({'status': 'success', 'message': 'Gasto registrado'})
     return jsonify({'status': 'error', 'message': 'Error al guardar'}), 500
 
+@app.route('/api/checkout', methods=['POST'])
+@login_required
+def checkout():
+    """Register every service and product of a client visit in one transaction."""
+    data = request.json or {}
+    sede = data.get('sede', 'Principal')
+    metodo_pago = data.get('metodo_pago', 'Efectivo')
+    cliente = data.get('cliente')
+    items = data.get('items') or []
+    if not items:
+        return jsonify({'status': 'error', 'message': 'No hay items para registrar'}), 400
+
+    fecha = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    servicios = []
+    productos = []
+    try:
+        for item in items:
+            valor = float(item['valor'])
+            if item.get('tipo') == 'servicio':
+                comision = calculate_commission(item['estilista'], item['servicio'], valor)
+                servicios.append((sede, fecha, item['estilista'], item['servicio'], valor, comision,
+                                  item.get('metodo_pago', metodo_pago), cliente))
+            elif item.get('tipo') == 'producto':
+                productos.append((sede, fecha, item['estilista'], item['producto'], item.get('marca', ''),
+                                  item.get('descripcion', ''), valor, valor * 0.10,
+                                  item.get('metodo_pago', metodo_pago), cliente))
+            else:
+                return jsonify({'status': 'error', 'message': 'Tipo de item inválido'}), 400
+    except (KeyError, ValueError, TypeError):
+        return jsonify({'status': 'error', 'message': 'Datos de item incompletos o inválidos'}), 400
+
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        c.executemany('''INSERT INTO servicios (sede, fecha, estilista, servicio, valor, comision, metodo_pago, cliente)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', servicios)
+        c.executemany('''INSERT INTO productos (sede, fecha, estilista, producto, marca, descripcion, valor, comision, metodo_pago, cliente)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', productos)
+        decrement_inventory(c, sede, [p[3] for p in productos])
+        categorize_new_services(conn, [s[3] for s in servicios])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error in checkout: {e}")
+        return jsonify({'status': 'error', 'message': 'Error al guardar'}), 500
+    finally:
+        conn.close()
+
+    comision_total = sum(s[5] for s in servicios) + sum(p[7] for p in productos)
+    return jsonify({
+        'status': 'success',
+        'message': 'Venta registrada',
+        'servicios': len(servicios),
+        'productos': len(productos),
+        'comision': comision_total
+    })
+
 @app.route('/api/inventory', methods=['GET'])
 @login_required
 def get_inventory():
     try:
         sede_filter = request.args.get('sede', 'Principal')
         conn = get_db_connection()
-        # Use pandas to read from SQL for easy dictionary conversion
-        df = pd.read_sql('SELECT * FROM inventario WHERE sede = ?', conn, params=(sede_filter,))
+        c = conn.cursor()
+        c.execute('SELECT * FROM inventario WHERE sede = ? ORDER BY id', (sede_filter,))
+        # Empty columns are sent as '' (the inventory screen expects strings)
+        inventory = rows_to_dicts(c, null='')
         conn.close()
-        
-        # Replace NaN with empty string or 0 for JSON serialization
-        df = df.fillna('')
-        inventory = df.to_dict(orient='records')
         return jsonify({'status': 'success', 'data': inventory})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -719,86 +1109,15 @@ def get_summary():
         # Get date and sede from query parameters
         date_filter = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
         sede_filter = request.args.get('sede', 'Principal')
-        summary_data = []
-        total_valor = 0
-        total_comision = 0
-        total_gastos = 0
 
         conn = get_db_connection()
-        
-        # Read Services
-        try:
-            # Filter by date and sede using SQL
-            df_services = pd.read_sql("SELECT * FROM servicios WHERE date(fecha) = ? AND sede = ?", 
-                                     conn, params=(date_filter, sede_filter))
-            for _, row in df_services.iterrows():
-                val = float(row['valor']) if pd.notna(row['valor']) else 0.0
-                com = float(row['comision']) if pd.notna(row['comision']) else 0.0
-                metodo = row['metodo_pago'] if pd.notna(row['metodo_pago']) else 'N/A'
-                    
-                summary_data.append({
-                    'id': int(row['id']),
-                    'sheet': 'servicios',
-                    'estilista': row['estilista'],
-                    'descripcion': row['servicio'],
-                    'valor': val,
-                    'comision': com,
-                    'tipo': 'Servicio',
-                    'metodo_pago': metodo
-                })
-                total_valor += val
-                total_comision += com
-        except Exception as e:
-            print(f"Error reading services: {e}")
-
-        # Read Products
-        try:
-            df_products = pd.read_sql("SELECT * FROM productos WHERE date(fecha) = ? AND sede = ?", 
-                                     conn, params=(date_filter, sede_filter))
-            for _, row in df_products.iterrows():
-                val = float(row['valor']) if pd.notna(row['valor']) else 0.0
-                com = float(row['comision']) if pd.notna(row['comision']) else 0.0
-                metodo = row['metodo_pago'] if pd.notna(row['metodo_pago']) else 'N/A'
-
-                summary_data.append({
-                    'id': int(row['id']),
-                    'sheet': 'productos',
-                    'estilista': row['estilista'],
-                    'descripcion': row['producto'],
-                    'valor': val,
-                    'comision': com,
-                    'tipo': 'Producto',
-                    'metodo_pago': metodo
-                })
-                total_valor += val
-                total_comision += com
-        except Exception as e:
-            print(f"Error reading products: {e}")
-
-        # Read Expenses
-        try:
-            df_expenses = pd.read_sql("SELECT * FROM gastos WHERE date(fecha) = ? AND sede = ?", 
-                                     conn, params=(date_filter, sede_filter))
-            for _, row in df_expenses.iterrows():
-                val = float(row['valor']) if pd.notna(row['valor']) else 0.0
-                total_gastos += val
-        except Exception as e:
-            print(f"Error reading expenses: {e}")
-
+        summary_data, totals = build_day_summary(conn, sede_filter, *day_bounds(date_filter))
         conn.close()
-        
-        # Calculate profit: Net Sales - Expenses - Commissions
-        utilidad = total_valor - total_gastos - total_comision
 
         return jsonify({
             'status': 'success',
             'data': summary_data,
-            'totals': {
-                'valor': total_valor,
-                'comision': total_comision,
-                'gastos': total_gastos,
-                'utilidad': utilidad
-            }
+            'totals': totals
         })
     except Exception as e:
         import traceback
@@ -841,99 +1160,49 @@ def update_summary_item():
 def render_pdf(template_src, context_dict):
     template = app.jinja_env.get_template(template_src)
     html = template.render(context_dict)
+    from xhtml2pdf import pisa
     result = BytesIO()
     pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
     if not pdf.err:
         return result.getvalue()
     return None
 
+def template_source(template_src):
+    return app.jinja_env.loader.get_source(app.jinja_env, template_src)[0]
+
+def day_report(date_filter, sede_filter):
+    """Context, cache key and download name of the day-close PDF."""
+    conn = get_db_connection()
+    summary_data, totals = build_day_summary(conn, sede_filter, *day_bounds(date_filter))
+    conn.close()
+
+    context = {
+        'date': date_filter,
+        'sede': sede_filter,
+        'data': summary_data,
+        'totals': totals
+    }
+    key = content_key(template_source('pdf_report.html'), context)
+    return context, key, f'Cierre_{sede_filter}_{date_filter}.pdf'
+
+def send_pdf(path, filename):
+    return send_file(path, mimetype='application/pdf', as_attachment=True, download_name=filename)
+
 @app.route('/export_pdf')
 @login_required
 def export_pdf():
     try:
         date_filter = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
         sede_filter = request.args.get('sede', 'Principal')
-        
-        summary_data = []
-        total_valor = 0
-        total_comision = 0
-        total_gastos = 0
-
-        conn = get_db_connection()
-        
-        # Read Services
-        try:
-            df_services = pd.read_sql("SELECT * FROM servicios WHERE date(fecha) = ? AND sede = ?", 
-                                     conn, params=(date_filter, sede_filter))
-            for _, row in df_services.iterrows():
-                val = float(row['valor']) if pd.notna(row['valor']) else 0.0
-                com = float(row['comision']) if pd.notna(row['comision']) else 0.0
-                metodo = row['metodo_pago'] if pd.notna(row['metodo_pago']) else 'N/A'
-                    
-                summary_data.append({
-                    'estilista': row['estilista'],
-                    'descripcion': row['servicio'],
-                    'valor': val,
-                    'comision': com,
-                    'tipo': 'Servicio',
-                    'metodo_pago': metodo
-                })
-                total_valor += val
-                total_comision += com
-        except: pass
-
-        # Read Products
-        try:
-            df_products = pd.read_sql("SELECT * FROM productos WHERE date(fecha) = ? AND sede = ?", 
-                                     conn, params=(date_filter, sede_filter))
-            for _, row in df_products.iterrows():
-                val = float(row['valor']) if pd.notna(row['valor']) else 0.0
-                com = float(row['comision']) if pd.notna(row['comision']) else 0.0
-                metodo = row['metodo_pago'] if pd.notna(row['metodo_pago']) else 'N/A'
-
-                summary_data.append({
-                    'estilista': row['estilista'],
-                    'descripcion': row['producto'],
-                    'valor': val,
-                    'comision': com,
-                    'tipo': 'Producto',
-                    'metodo_pago': metodo
-                })
-                total_valor += val
-                total_comision += com
-        except: pass
-
-        # Read Expenses
-        try:
-            df_expenses = pd.read_sql("SELECT * FROM gastos WHERE date(fecha) = ? AND sede = ?", 
-                                     conn, params=(date_filter, sede_filter))
-            for _, row in df_expenses.iterrows():
-                val = float(row['valor']) if pd.notna(row['valor']) else 0.0
-                total_gastos += val
-        except: pass
 
-        conn.close()
-        
-        utilidad = total_valor - total_gastos - total_comision
-        
-        context = {
-            'date': date_filter,
-            'sede': sede_filter,
-            'summary': summary_data,
-            'totals': {
-                'valor': total_valor,
-                'comision': total_comision,
-                'gastos': total_gastos,
-                'utilidad': utilidad
-            }
-        }
+        context, key, filename = day_report(date_filter, sede_filter)
+        cached = pdf_exports.lookup(key)
+        if cached:
+            return send_pdf(cached, filename)
         
         pdf = render_pdf('pdf_report.html', context)
         if pdf:
-            response = make_response(pdf)
-            response.headers['Content-Type'] = 'application/pdf'
-            response.headers['Content-Disposition'] = f'attachment; filename=Cierre_{sede_filter}_{date_filter}.pdf'
-            return response
+            return send_pdf(pdf_exports.store(key, pdf), filename)
         
         return "Error generating PDF", 500
     except Exception as e:
@@ -941,136 +1210,118 @@ def export_pdf():
         traceback.print_exc()
         return str(e), 500
 
+@app.route('/api/export_pdf/jobs', methods=['POST'])
+@login_required
+def submit_pdf_export():
+    try:
+        data = request.json or {}
+        date_filter = data.get('date') or datetime.now().strftime('%Y-%m-%d')
+        sede_filter = data.get('sede', 'Principal')
+
+        context, key, filename = day_report(date_filter, sede_filter)
+
+        def render():
+            with app.app_context():
+                return render_pdf('pdf_report.html', context)
+
+        job = pdf_exports.submit(key, render, filename)
+        return jsonify({'status': 'success', 'job': job})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/export_pdf/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_pdf_export(job_id):
+    job = pdf_exports.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Exportación no encontrada'}), 404
+    return jsonify({'status': 'success', 'job': job})
+
+@app.route('/export_pdf/jobs/<job_id>/download')
+@login_required
+def download_pdf_export(job_id):
+    path, filename = pdf_exports.result_path(job_id)
+    if not path:
+        return "El PDF no está disponible", 404
+    return send_pdf(path, filename)
+
+MAX_TIMELINE_YEARS = 20
+
 @app.route('/api/statistics', methods=['GET'])
 @login_required
 def get_statistics():
     try:
         # Get month from query parameter (format: YYYY-MM)
         month_filter = request.args.get('month', datetime.now().strftime('%Y-%m'))
-        year, month = month_filter.split('-')
+        try:
+            month_start = datetime.strptime(month_filter, '%Y-%m')
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Mes inválido, use AAAA-MM'}), 400
+        month_filter = month_start.strftime('%Y-%m')
+        year = month_start.year
         sede_filter = request.args.get('sede', '') # Optional sede filter
+        # Number of years in the sales timeline (default: last 3)
+        timeline_years = min(max(request.args.get('years', 3, type=int), 1), MAX_TIMELINE_YEARS)
         
         conn = get_db_connection()
         
-        # Read data from SQLite
-        servicios_df = pd.read_sql("SELECT * FROM servicios", conn)
-        productos_df = pd.read_sql("SELECT * FROM productos", conn)
-        gastos_df = pd.read_sql("SELECT * FROM gastos", conn)
-        inventario_df = pd.read_sql("SELECT * FROM inventario", conn)
-        gastos_mensuales_df = pd.read_sql("SELECT * FROM gastos_mensuales", conn)
-        
-        conn.close()
-        
-        # Apply Sede Filter if provided
-        if sede_filter:
-             servicios_df = servicios_df[servicios_df['sede'] == sede_filter]
-             productos_df = productos_df[productos_df['sede'] == sede_filter]
-             gastos_df = gastos_df[gastos_df['sede'] == sede_filter]
-             inventario_df = inventario_df[inventario_df['sede'] == sede_filter]
-             gastos_mensuales_df = gastos_mensuales_df[gastos_mensuales_df['sede'] == sede_filter]
-
-        # Filter by month with robust date parsing
-        servicios_df['fecha'] = pd.to_datetime(servicios_df['fecha'], errors='coerce')
-        productos_df['fecha'] = pd.to_datetime(productos_df['fecha'], errors='coerce')
-        gastos_df['fecha'] = pd.to_datetime(gastos_df['fecha'], errors='coerce')
-        
-        # Drop rows with invalid dates if any
-        servicios_df = servicios_df.dropna(subset=['fecha'])
-        productos_df = productos_df.dropna(subset=['fecha'])
-        gastos_df = gastos_df.dropna(subset=['fecha'])
-        
-        servicios_month = servicios_df[(servicios_df['fecha'].dt.year == int(year)) & 
-                                       (servicios_df['fecha'].dt.month == int(month))]
-        productos_month = productos_df[(productos_df['fecha'].dt.year == int(year)) & 
-                                       (productos_df['fecha'].dt.month == int(month))]
-        gastos_month = gastos_df[(gastos_df['fecha'].dt.year == int(year)) & 
-                                 (gastos_df['fecha'].dt.month == int(month))]
-        
+        # Totals, payroll and timeline come from the pre-summed daily_totals
+        totales_mes = month_totals(conn, month_filter, sede_filter)
+        por_estilista = month_by_stylist(conn, month_filter, sede_filter)
+        timeline_data = sales_timeline(conn, year, timeline_years, sede_filter)
+
+        sede_sql = ' AND sede = ?' if sede_filter else ''
+        sede_params = [sede_filter] if sede_filter else []
+        mes_inicio, mes_fin = month_bounds(month_filter)
+        c = conn.cursor()
+
+        # Top Servicios (Frecuencia) del mes
+        c.execute(f'''SELECT servicio, COUNT(*) FROM servicios
+                      WHERE fecha >= ? AND fecha < ?{sede_sql} AND servicio IS NOT NULL
+                      GROUP BY servicio
+                      ORDER BY COUNT(*) DESC, MIN(id)
+                      LIMIT 10''', [mes_inicio, mes_fin] + sede_params)
+        top_servicios = dict(c.fetchall())
+
         # Gastos Mensuales
-        gastos_mensuales_month = gastos_mensuales_df[gastos_mensuales_df['mes'] == month_filter]
+        c.execute(f"SELECT tipo, valor FROM gastos_mensuales WHERE mes = ?{sede_sql} ORDER BY id",
+                  [month_filter] + sede_params)
+        gastos_mensuales_detalle = [{'tipo': row['tipo'], 'valor': row['valor']} for row in c.fetchall()]
+
+        # Inventario resumido - Agrupado por producto (unidad del primer registro)
+        c.execute(f'''SELECT producto, IFNULL(unidad, '') AS unidad, MIN(id) AS first_id,
+                             SUM(IFNULL(cantidad, 0)) AS cantidad,
+                             SUM(IFNULL(cantidad, 0) * IFNULL(valor, 0)) AS valor_total
+                      FROM inventario
+                      WHERE producto IS NOT NULL AND producto != ''{sede_sql}
+                      GROUP BY producto
+                      ORDER BY first_id''', sede_params)
+        inventario_resumido = [{
+            'producto': row['producto'],
+            'cantidad': float(row['cantidad']),
+            'unidad': row['unidad'],
+            'valor_total': float(row['valor_total'])
+        } for row in c.fetchall()]
+
+        # Estado Inventario
+        c.execute(f'''SELECT IFNULL(SUM(IFNULL(cantidad, 0) > 0), 0), IFNULL(SUM(IFNULL(cantidad, 0) <= 0), 0)
+                      FROM inventario WHERE 1 = 1{sede_sql}''', sede_params)
+        disponibles, agotados = c.fetchone()
+
+        conn.close()
 
         # Calculate totals
-        total_ventas = servicios_month['valor'].sum() + productos_month['valor'].sum()
-        total_gastos = gastos_month['valor'].sum()
-        total_nomina = servicios_month['comision'].sum() + productos_month['comision'].sum()
+        total_ventas = totales_mes['ventas']
+        total_gastos = totales_mes['gastos']
+        total_nomina = totales_mes['nomina']
         utilidad_operativa = total_ventas - total_gastos - total_nomina
         
-        total_gastos_fijos = gastos_mensuales_month['valor'].sum()
+        total_gastos_fijos = sum(gasto['valor'] or 0 for gasto in gastos_mensuales_detalle)
         utilidad_real = utilidad_operativa - total_gastos_fijos
         
-        # Nómina por estilista
-        nomina_servicios = servicios_month.groupby('estilista')['comision'].sum()
-        nomina_productos = productos_month.groupby('estilista')['comision'].sum()
-        nomina_por_estilista = (nomina_servicios.add(nomina_productos, fill_value=0)).to_dict()
-        
-        # Ventas por estilista
-        ventas_servicios = servicios_month.groupby('estilista')['valor'].sum()
-        ventas_productos = productos_month.groupby('estilista')['valor'].sum()
-        ventas_por_estilista = (ventas_servicios.add(ventas_productos, fill_value=0)).to_dict()
-        
-        # Inventario resumido - Agrupado por producto
-        inventario_agrupado = {}
-        for _, row in inventario_df.iterrows():
-            try:
-                producto = row['producto'] if pd.notna(row['producto']) else ''
-                if not producto:
-                    continue
-                    
-                cantidad = float(row['cantidad']) if pd.notna(row['cantidad']) else 0.0
-                valor = float(row['valor']) if pd.notna(row['valor']) else 0.0
-                unidad = row['unidad'] if pd.notna(row['unidad']) else ''
-                
-                # Si el producto ya existe, sumar las cantidades y valores
-                if producto in inventario_agrupado:
-                    inventario_agrupado[producto]['cantidad'] += cantidad
-                    inventario_agrupado[producto]['valor_total'] += cantidad * valor
-                else:
-                    inventario_agrupado[producto] = {
-                        'producto': producto,
-                        'cantidad': cantidad,
-                        'unidad': unidad,
-                        'valor_total': cantidad * valor
-                    }
-            except:
-                continue
-        
-        # Convertir el diccionario a lista
-        inventario_resumido = list(inventario_agrupado.values())
-            
-        # Yearly Sales Timeline - Last 3 Years
-        meses = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 
-                 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-        timeline_data = {}
-        
-        for y in range(int(year) - 2, int(year) + 1):
-            ventas_anuales = []
-            for m in range(1, 13):
-                try:
-                    s_month = servicios_df[(servicios_df['fecha'].dt.year == y) & 
-                                           (servicios_df['fecha'].dt.month == m)]
-                    p_month = productos_df[(productos_df['fecha'].dt.year == y) & 
-                                           (productos_df['fecha'].dt.month == m)]
-                    total = s_month['valor'].sum() + p_month['valor'].sum()
-                    ventas_anuales.append(float(total))
-                except:
-                    ventas_anuales.append(0.0)
-            timeline_data[str(y)] = ventas_anuales
-        
-        # Top Servicios (Frecuencia)
-        top_servicios = servicios_month['servicio'].value_counts().head(10).to_dict()
-        
-        # Estado Inventario
-        disponibles = 0
-        agotados = 0
-        for _, row in inventario_df.iterrows():
-            try:
-                qty = float(row['cantidad']) if pd.notna(row['cantidad']) else 0
-                if qty > 0:
-                    disponibles += 1
-                else:
-                    agotados += 1
-            except:
-                pass
+        # Nómina y ventas por estilista
+        nomina_por_estilista = {k: nomina for k, (ventas, nomina) in por_estilista.items()}
+        ventas_por_estilista = {k: ventas for k, (ventas, nomina) in por_estilista.items()}
         
         estado_inventario = {
             'Disponibles': disponibles,
@@ -1088,7 +1339,7 @@ def get_statistics():
                     'gastos_fijos': float(total_gastos_fijos),
                     'utilidad_real': float(utilidad_real)
                 },
-                'gastos_mensuales_detalle': gastos_mensuales_month[['tipo', 'valor']].to_dict(orient='records'),
+                'gastos_mensuales_detalle': gastos_mensuales_detalle,
                 'nomina_por_estilista': {k: float(v) for k, v in nomina_por_estilista.items()},
                 'ventas_por_estilista': {k: float(v) for k, v in ventas_por_estilista.items()},
                 'top_servicios': top_servicios,
@@ -1206,21 +1457,16 @@ def get_appointments():
         params = [sede_filter]
         
         if date_filter:
-            query += " AND date(fecha) = ?"
-            params.append(date_filter)
-            
-        df = pd.read_sql(query, conn, params=params)
-        conn.close()
-            
-        df = df.fillna('')
-        
+            query += " AND fecha >= ? AND fecha < ?"
+            params.extend(day_bounds(date_filter))
+
         # Sort by Time
-        try:
-            df = df.sort_values('hora')
-        except:
-            pass
+        query += " ORDER BY hora"
 
-        appointments = df.to_dict(orient='records')
+        c = conn.cursor()
+        c.execute(query, params)
+        appointments = rows_to_dicts(c, null='')
+        conn.close()
         return jsonify({'status': 'success', 'data': appointments})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -1231,9 +1477,9 @@ def get_alerts():
         today = datetime.now().strftime('%Y-%m-%d')
         
         conn = get_db_connection()
-        query = "SELECT count(*) as count FROM citas WHERE date(fecha) = ?"
+        query = "SELECT count(*) as count FROM citas WHERE fecha >= ? AND fecha < ?"
         c = conn.cursor()
-        c.execute(query, (today,))
+        c.execute(query, day_bounds(today))
         count = c.fetchone()['count']
         conn.close()
         
@@ -1307,12 +1553,12 @@ def get_monthly_expenses():
         if mes:
             query += " AND mes = ?"
             params.append(mes)
-            
-        df = pd.read_sql(query, conn, params=params)
+        query += " ORDER BY id"
+
+        c = conn.cursor()
+        c.execute(query, params)
+        data = rows_to_dicts(c, null='')
         conn.close()
-            
-        df = df.fillna('')
-        data = df.to_dict(orient='records')
         return jsonify({'status': 'success', 'data': data})
         
     except Exception as e:
@@ -1320,178 +1566,108 @@ def get_monthly_expenses():
 
 @app.route('/api/prediction', methods=['GET'])
 @login_required
+@cached_by_data_version
 def get_prediction():
     try:
         sede_filter = request.args.get('sede', 'Principal')
-        
+        today = datetime.now().date()
+
         conn = get_db_connection()
-        # Load data
-        df_servicios = pd.read_sql("SELECT fecha, valor FROM servicios WHERE sede = ?", conn, params=(sede_filter,))
-        df_productos = pd.read_sql("SELECT fecha, valor FROM productos WHERE sede = ?", conn, params=(sede_filter,))
+        # Daily income of the last 11 months plus the stored regression state (see forecasting.py)
+        historical = income_history(conn, sede_filter, today)
+        result = forecast(conn, sede_filter, today)
         conn.close()
-        
-        # Convert fecha to datetime and floor to date
-        df_servicios['fecha'] = pd.to_datetime(df_servicios['fecha'], errors='coerce')
-        df_productos['fecha'] = pd.to_datetime(df_productos['fecha'], errors='coerce')
-        
-        # Drop invalid dates and convert to date object
-        df_servicios = df_servicios.dropna(subset=['fecha'])
-        df_productos = df_productos.dropna(subset=['fecha'])
-        
-        df_servicios['fecha'] = df_servicios['fecha'].dt.date
-        df_productos['fecha'] = df_productos['fecha'].dt.date
-        
-        # Aggregate by date
-        daily_servicios = df_servicios.groupby('fecha')['valor'].sum()
-        daily_productos = df_productos.groupby('fecha')['valor'].sum()
-        
-        # Combine
-        daily_income = daily_servicios.add(daily_productos, fill_value=0).sort_index()
-        
-        # Convert to DataFrame
-        income_df = daily_income.reset_index()
-        income_df.columns = ['fecha', 'valor']
-        
-        # Get last 11 months of data (approximately 330 days)
-        today = datetime.now().date()
-        eleven_months_ago = today - pd.Timedelta(days=330)
-        income_df = income_df[income_df['fecha'] >= eleven_months_ago]
-        
-        if income_df.empty:
+
+        if not historical or result is None:
             return jsonify({'status': 'success', 'historical': [], 'prediction': []})
-            
-        # Prepare for prediction (Linear Regression)
-        import numpy as np
-        
-        income_df['ordinal'] = income_df['fecha'].apply(lambda x: x.toordinal())
-        X = income_df['ordinal'].values.reshape(-1, 1)
-        y = income_df['valor'].values
-        
-        # Simple Linear Regression: y = mx + b
-        if len(income_df) > 1:
-            n = len(X)
-            sum_x = np.sum(X)
-            sum_y = np.sum(y)
-            sum_xx = np.sum(X**2)
-            sum_xy = np.sum(X * y.reshape(-1, 1))
-            
-            denominator = (n * sum_xx - sum_x**2)
-            if denominator == 0:
-                slope = 0
-                intercept = np.mean(y)
-            else:
-                slope = (n * sum_xy - sum_x * sum_y) / denominator
-                intercept = (sum_y - slope * sum_x) / n
-        else:
-            slope = 0
-            intercept = y[0] if len(y) > 0 else 0
-            
-        # Generate next 7 days
-        predictions = []
-        last_date = income_df['fecha'].max()
-        for i in range(1, 8):
-            pred_date = last_date + pd.Timedelta(days=i)
-            pred_ordinal = pred_date.toordinal()
-            pred_value = max(0, slope * pred_ordinal + intercept)
-            predictions.append({
-                'fecha': pred_date.strftime('%Y-%m-%d'),
-                'valor': float(pred_value)
-            })
-            
-        historical = []
-        for _, row in income_df.iterrows():
-            historical.append({
-                'fecha': row['fecha'].strftime('%Y-%m-%d'),
-                'valor': float(row['valor'])
-            })
-            
+
         return jsonify({
             'status': 'success',
             'historical': historical,
-            'prediction': predictions,
-            'trend': 'up' if slope > 0 else 'down' if slope < 0 else 'stable'
+            'prediction': result['prediction'],
+            'trend': result['trend']
         })
-        
+
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# /api/revenue-patterns: default window and the largest range a request may ask for
+PATTERNS_DEFAULT_WEEKS = 52
+PATTERNS_MAX_DAYS = 3 * 366
+DAY_NAMES_EN = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
 @app.route('/api/revenue-patterns', methods=['GET'])
 @login_required
+@cached_by_data_version
 def get_revenue_patterns():
     try:
         sede_filter = request.args.get('sede', 'Principal')
-        
+
+        # Range [from, to], both inclusive; defaults to the last 52 weeks
+        today = datetime.now().date()
+        try:
+            date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else today
+            date_from = (datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from')
+                         else date_to - timedelta(weeks=PATTERNS_DEFAULT_WEEKS) + timedelta(days=1))
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Fechas inválidas, use AAAA-MM-DD'}), 400
+        if date_from > date_to:
+            return jsonify({'status': 'error', 'message': 'La fecha inicial es posterior a la final'}), 400
+        if (date_to - date_from).days >= PATTERNS_MAX_DAYS:
+            return jsonify({'status': 'error', 'message': f'El rango no puede superar {PATTERNS_MAX_DAYS} días'}), 400
+
         conn = get_db_connection()
-        # Load data
-        df_servicios = pd.read_sql("SELECT fecha, valor FROM servicios WHERE sede = ?", conn, params=(sede_filter,))
-        df_productos = pd.read_sql("SELECT fecha, valor FROM productos WHERE sede = ?", conn, params=(sede_filter,))
+        rows = sales_by_day(conn, date_from.strftime('%Y-%m-%d'),
+                            (date_to + timedelta(days=1)).strftime('%Y-%m-%d'), sede_filter)
         conn.close()
-        
-        # Convert fecha
-        df_servicios['fecha'] = pd.to_datetime(df_servicios['fecha'], errors='coerce')
-        df_productos['fecha'] = pd.to_datetime(df_productos['fecha'], errors='coerce')
-        
-        # Drop invalid and convert to date
-        df_servicios = df_servicios.dropna(subset=['fecha'])
-        df_productos = df_productos.dropna(subset=['fecha'])
-        
-        df_servicios['fecha'] = df_servicios['fecha'].dt.date
-        df_productos['fecha'] = df_productos['fecha'].dt.date
-        
-        # Group by date
-        daily_servicios = df_servicios.groupby('fecha')['valor'].sum()
-        daily_productos = df_productos.groupby('fecha')['valor'].sum()
-        
-        daily_revenue = daily_servicios.add(daily_productos, fill_value=0).sort_index()
-        
-        # Reset index
-        df = daily_revenue.reset_index()
-        df.columns = ['fecha', 'valor']
-        
-        # Use all historical data (no date filter)
-        if df.empty:
+
+        if not rows:
             return jsonify({'status': 'success', 'heatmap': [], 'patterns': {}, 'inference': 'Datos insuficientes'})
-            
-        # 1. Heatmap Data (Week vs Day)
+
+        # 1. Heatmap Data (Week vs Day) and 2. per-weekday sums, from the same rows
         heatmap_data = []
-        for _, row in df.iterrows():
-            dt = pd.to_datetime(row['fecha'])
+        weekday_totals = {}
+        for dia, day_index, week, valor in rows:
             heatmap_data.append({
-                'date': row['fecha'].strftime('%Y-%m-%d'),
-                'day': dt.day_name(), 
-                'day_index': dt.dayofweek, # 0=Mon
-                'week': int(dt.isocalendar()[1]),
-                'value': float(row['valor'])
+                'date': dia,
+                'day': DAY_NAMES_EN[day_index],
+                'day_index': day_index, # 0=Mon
+                'week': week,
+                'value': float(valor)
             })
-            
-        # 2. Average Stats by Day of Week
-        df['dayofweek'] = pd.to_datetime(df['fecha']).dt.dayofweek
-        patterns = df.groupby('dayofweek')['valor'].mean().to_dict()
-        
+            total, count = weekday_totals.get(day_index, (0.0, 0))
+            weekday_totals[day_index] = (total + valor, count + 1)
+
+        # Average Stats by Day of Week
+        patterns = {k: total / count for k, (total, count) in sorted(weekday_totals.items())}
+
         day_map = {0: 'Lunes', 1: 'Martes', 2: 'Miércoles', 3: 'Jueves', 4: 'Viernes', 5: 'Sábado', 6: 'Domingo'}
         named_patterns = {day_map[k]: float(v) for k, v in patterns.items()}
-        
+
         # 3. Inference
+        period = f"entre el {date_from.strftime('%Y-%m-%d')} y el {date_to.strftime('%Y-%m-%d')}"
         sorted_days = sorted(patterns.items(), key=lambda x: x[1], reverse=True)
         if len(sorted_days) >= 2:
             best_day_1 = day_map[sorted_days[0][0]]
             best_day_2 = day_map[sorted_days[1][0]]
-            inference = f"Basado en todos los datos históricos, los días con mayor probabilidad de altos ingresos son los {best_day_1} y {best_day_2}."
+            inference = f"Basado en los datos {period}, los días con mayor probabilidad de altos ingresos son los {best_day_1} y {best_day_2}."
         elif len(sorted_days) == 1:
             best_day = day_map[sorted_days[0][0]]
-            inference = f"Basado en todos los datos históricos, el día con mayor probabilidad de altos ingresos es el {best_day}."
+            inference = f"Basado en los datos {period}, el día con mayor probabilidad de altos ingresos es el {best_day}."
         else:
             inference = "No hay suficientes datos para generar una inferencia."
-            
+
         return jsonify({
-            'status': 'success', 
-            'heatmap': heatmap_data, 
-            'patterns': named_patterns, 
+            'status': 'success',
+            'from': date_from.strftime('%Y-%m-%d'),
+            'to': date_to.strftime('%Y-%m-%d'),
+            'heatmap': heatmap_data,
+            'patterns': named_patterns,
             'inference': inference
         })
-        
+
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -1499,124 +1675,80 @@ def get_revenue_patterns():
 
 @app.route('/api/service-demand', methods=['GET'])
 @login_required
+@cached_by_data_version
 def get_service_demand():
     try:
         import numpy as np
         sede_filter = request.args.get('sede', 'Principal')
-        
+
+        # Last 60 days
+        today = datetime.now().date()
+        since = (today - timedelta(days=60)).strftime('%Y-%m-%d')
+
         conn = get_db_connection()
-        # Load services data
-        df_servicios = pd.read_sql("SELECT fecha, servicio, sede FROM servicios WHERE sede = ?", conn, params=(sede_filter,))
+        c = conn.cursor()
+        # Services per day and category. Names written by other tools since
+        # startup have no stored category yet: they come back by name and get
+        # the default rule here (this GET never writes)
+        placeholders = ', '.join('?' for _ in DEMAND_CATEGORIES)
+        c.execute(f'''SELECT date(s.fecha) AS dia, m.categoria,
+                             CASE WHEN m.categoria IS NULL THEN s.servicio END AS sin_categoria, COUNT(*)
+                      FROM servicios s LEFT JOIN servicio_categorias m ON m.servicio = s.servicio
+                      WHERE s.sede = ? AND s.fecha >= ? AND date(s.fecha) IS NOT NULL
+                        AND (m.categoria IN ({placeholders}) OR m.categoria IS NULL)
+                      GROUP BY dia, m.categoria, sin_categoria
+                      ORDER BY dia''', [sede_filter, since] + DEMAND_CATEGORIES)
+        cat_index = {cat: j for j, cat in enumerate(DEMAND_CATEGORIES)}
+        rows = []
+        for dia, categoria, sin_categoria, count in c.fetchall():
+            categoria = categoria or categorize_service(sin_categoria)
+            if categoria in cat_index:
+                rows.append((dia, categoria, count))
         conn.close()
-        
-        if df_servicios.empty:
-             return jsonify({'status': 'success', 'historical': [], 'prediction': [], 'growthService': None})
 
-        # Convert fecha
-        df_servicios['fecha'] = pd.to_datetime(df_servicios['fecha'], errors='coerce')
-        df_servicios = df_servicios.dropna(subset=['fecha'])
-        df_servicios['fecha'] = df_servicios['fecha'].dt.date
-        
-        # Filter last 60 days
-        today = datetime.now().date()
-        sixty_days_ago = today - pd.Timedelta(days=60)
-        df_recent = df_servicios[df_servicios['fecha'] >= sixty_days_ago].copy()
-        
-        if df_recent.empty:
+        if not rows:
             return jsonify({'status': 'success', 'historical': [], 'prediction': [], 'growthService': None})
 
-        # Categorize Services
-        def categorize_service(name):
-            name = str(name).lower()
-            if 'corte' in name: return 'Corte'
-            if 'tinte' in name or 'mechas' in name or 'color' in name or 'iluminaciones' in name or 'keratina' in name: return 'Tintura'
-            if 'manicure' in name or 'pedicure' in name or 'uñas' in name or 'semi' in name: return 'Uñas'
-            if 'depilacion' in name or 'cejas' in name or 'cera' in name or 'bigote' in name: return 'Depilación'
-            return 'Otros'
+        # Days x categories count matrix
+        days = sorted({row[0] for row in rows})
+        day_index = {d: i for i, d in enumerate(days)}
+        counts = np.zeros((len(days), len(DEMAND_CATEGORIES)), dtype=np.int64)
+        for dia, categoria, count in rows:
+            counts[day_index[dia], cat_index[categoria]] += count
+
+        historical = [
+            dict({'fecha': d}, **{cat: int(v) for cat, v in zip(DEMAND_CATEGORIES, counts[i])})
+            for i, d in enumerate(days)
+        ]
+
+        # Linear Regression for every category at once: y = mx + b, x in days since the first one
+        first_date = datetime.strptime(days[0], '%Y-%m-%d').date()
+        x = np.array([(datetime.strptime(d, '%Y-%m-%d').date() - first_date).days for d in days], dtype=np.float64)
+        y = counts.astype(np.float64)
+        n = len(x)
+        sum_x, sum_xx = x.sum(), (x * x).sum()
+        sum_y, sum_xy = y.sum(axis=0), x @ y
+
+        denom = n * sum_xx - sum_x ** 2
+        if n > 1 and denom != 0:
+            slopes = (n * sum_xy - sum_x * sum_y) / denom
+            intercepts = (sum_y - slopes * sum_x) / n
+        else:
+            slopes = np.zeros(len(DEMAND_CATEGORIES))
+            intercepts = sum_y / n
 
-        df_recent['tipo'] = df_recent['servicio'].apply(categorize_service)
-        
-        # Filter only expected types
-        expected = ['Corte', 'Tintura', 'Uñas', 'Depilación']
-        df_recent = df_recent[df_recent['tipo'].isin(expected)]
-        
-        # Group by Date and Tipo
-        daily_counts = df_recent.groupby(['fecha', 'tipo']).size().reset_index(name='count')
-        
-        # Pivot
-        pivot_df = daily_counts.pivot(index='fecha', columns='tipo', values='count').fillna(0).astype(int)
-        
-        # Ensure all columns exist
-        for col in expected:
-            if col not in pivot_df.columns:
-                pivot_df[col] = 0
-                
-        # Prepare Historical Data
-        historical = []
-        # Sort by date
-        pivot_df = pivot_df.sort_index()
-        
-        for date_val, row in pivot_df.iterrows():
-            entry = {'fecha': date_val.strftime('%Y-%m-%d')}
-            for col in expected:
-                entry[col] = int(row[col])
-            historical.append(entry)
-            
-        # Prediction
-        predictions = []
-        growth_scores = {}
-        
-        # Create a date range for regression X to be accurate
-        dates = pivot_df.index
-        X_dates = np.array([d.toordinal() for d in dates])
-        
-        last_date = dates.max()
-        next_7_days = [last_date + pd.Timedelta(days=i) for i in range(1, 8)]
-        next_7_ordinals = np.array([d.toordinal() for d in next_7_days])
-        
-        for col in expected:
-            y = pivot_df[col].values
-            X = X_dates.reshape(-1, 1)
-            
-            if len(y) > 1:
-                # Linear Regression
-                n = len(X)
-                sum_x = np.sum(X)
-                sum_y = np.sum(y)
-                sum_xx = np.sum(X**2)
-                sum_xy = np.sum(X.flatten() * y)
-                
-                denom = n * sum_xx - sum_x**2
-                if denom == 0:
-                    slope = 0
-                    intercept = np.mean(y)
-                else:
-                    slope = (n * sum_xy - sum_x * sum_y) / denom
-                    intercept = (sum_y - slope * sum_x) / n
-            else:
-                slope = 0
-                intercept = y[0] if len(y) > 0 else 0
-                
-            growth_scores[col] = slope
-            
-            col_preds = []
-            for ordinal in next_7_ordinals:
-                val = slope * ordinal + intercept
-                col_preds.append(max(0, val)) 
-            
-            # We need to structure 'predictions' as list of dicts: [{fecha:..., Corte:..., ...}, ...]
-            if not predictions:
-                for d in next_7_days:
-                    predictions.append({'fecha': d.strftime('%Y-%m-%d')})
-            
-            for i, val in enumerate(col_preds):
-                predictions[i][col] = float(val)
+        last_date = datetime.strptime(days[-1], '%Y-%m-%d').date()
+        next_7_days = [last_date + timedelta(days=i) for i in range(1, 8)]
+        next_x = x[-1] + np.arange(1, 8, dtype=np.float64)
+        values = np.maximum(0, np.outer(next_x, slopes) + intercepts)
 
-        # Determine highest growth
-        if growth_scores:
-            growth_service = max(growth_scores, key=growth_scores.get)
-        else:
-            growth_service = None
+        predictions = [
+            dict({'fecha': d.strftime('%Y-%m-%d')}, **{cat: float(v) for cat, v in zip(DEMAND_CATEGORIES, values[i])})
+            for i, d in enumerate(next_7_days)
+        ]
+
+        # Determine highest growth (first category on ties)
+        growth_service = DEMAND_CATEGORIES[int(np.argmax(slopes))]
 
         return jsonify({
             'status': 'success',
@@ -1624,12 +1756,30 @@ def get_service_demand():
             'prediction': predictions,
             'growthService': growth_service
         })
-        
+
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def count_admin_records(conn, table_name, where_clauses, params, sede):
+    """Row count of an admin table for the given filters, cached until the next write."""
+    version = data_version(conn, sede) if sede else total_data_version(conn)
+    key = (table_name, tuple(where_clauses), tuple(params), version)
+    total = admin_count_cache.get(key)
+    if total is None:
+        query = f"SELECT COUNT(*) FROM {table_name}"
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        c = conn.cursor()
+        c.execute(query, params)
+        total = c.fetchone()[0]
+        admin_count_cache.put(key, total)
+    return total
+
+# Largest page /api/admin/<table_name> serves; an empty limit ('Todos') streams every row
+ADMIN_MAX_PAGE_SIZE = 1000
+
 @app.route('/api/admin/<table_name>', methods=['GET'])
 @login_required
 def admin_get_records(table_name):
@@ -1642,9 +1792,28 @@ def admin_get_records(table_name):
         fecha = request.args.get('fecha')
         limit = request.args.get('limit', '100')
         offset = request.args.get('offset', '0')
-        
+        # Keyset pagination: rows older than before_id (next page) or newer than after_id (previous page)
+        before_id = request.args.get('before_id')
+        after_id = request.args.get('after_id')
+
+        # citas uses text UUIDs, the other tables integer ids
+        if table_name != 'citas':
+            before_id = int(before_id) if before_id else None
+            after_id = int(after_id) if after_id else None
+        page_size = int(limit) if limit else None
+        offset = int(offset) if offset else 0
+        if (page_size is not None and not 1 <= page_size <= ADMIN_MAX_PAGE_SIZE) or offset < 0:
+            raise ValueError(limit)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Parámetros de paginación inválidos'}), 400
+
+    try:
+        fecha_bounds = day_bounds(fecha) if fecha else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Fecha inválida, use AAAA-MM-DD'}), 400
+
+    try:
         conn = get_db_connection()
-        query = f"SELECT * FROM {table_name}"
         params = []
         where_clauses = []
         
@@ -1653,51 +1822,174 @@ def admin_get_records(table_name):
             params.append(sede)
         if fecha:
             # Use fecha_actualizacion for inventario table, fecha for others
-            if table_name == 'inventario':
-                where_clauses.append("date(fecha_actualizacion) = ?")
+            date_column = 'fecha_actualizacion' if table_name == 'inventario' else 'fecha'
+            where_clauses.append(f"{date_column} >= ? AND {date_column} < ?")
+            params.extend(fecha_bounds)
+
+        total = count_admin_records(conn, table_name, where_clauses, params, sede)
+        c = conn.cursor()
+
+        if after_id is not None:
+            where_clauses.append("id > ?")
+            params.append(after_id)
+            where_sql = " WHERE " + " AND ".join(where_clauses)
+            limit_sql = f" LIMIT {page_size}" if page_size else ""
+            has_newer = False
+            if page_size:
+                c.execute(f"SELECT 1 FROM {table_name}{where_sql} ORDER BY id ASC LIMIT 1 OFFSET {page_size}", params)
+                has_newer = c.fetchone() is not None
+            # Walk up from the cursor, then show the page newest first like the others
+            query = f"SELECT * FROM (SELECT * FROM {table_name}{where_sql} ORDER BY id ASC{limit_sql}) ORDER BY id DESC"
+            max_rows = None
+        else:
+            if before_id is not None:
+                where_clauses.append("id < ?")
+                params.append(before_id)
+            query = f"SELECT * FROM {table_name}"
+            if where_clauses:
+                query += " WHERE " + " AND ".join(where_clauses)
+            query += " ORDER BY id DESC"
+            if page_size:
+                # One extra row tells whether there is another page
+                query += f" LIMIT {page_size + 1}"
+            if offset and before_id is None:
+                query += f" OFFSET {offset}"
+            max_rows = page_size
+
+        c.execute(query, params)
+
+        def page_cursors(first_row, last_row, has_more):
+            if after_id is not None:
+                older, newer = True, has_newer
             else:
-                where_clauses.append("date(fecha) = ?")
-            params.append(fecha)
-            
-        if where_clauses:
-            query += " WHERE " + " AND ".join(where_clauses)
-            
-        query += " ORDER BY id DESC"
-        
-        if limit:
-            query += f" LIMIT {int(limit)}"
-        if offset:
-            query += f" OFFSET {int(offset)}"
-            
-        df = pd.read_sql(query, conn, params=params)
-        conn.close()
-        
-        # Replace NaN/None values with None (null in JSON)
-        # First convert all NaN to None
-        df = df.astype(object).where(pd.notna(df), None)
-        
-        # Convert DataFrame to list of dicts and handle any remaining NaN values
-        data = df.to_dict(orient='records')
-        
-        # Final safety check to replace any NaN values
-        def replace_nan(obj):
-            if isinstance(obj, dict):
-                return {k: (None if (isinstance(v, float) and pd.isna(v)) else v) for k, v in obj.items()}
-            return obj
-        
-        data = [replace_nan(record) for record in data]
-        
-        return jsonify({
-            'status': 'success', 
-            'data': data,
-            'columns': list(df.columns)
-        })
+                older, newer = has_more, before_id is not None or offset > 0
+            return {
+                'total': total,
+                'next_cursor': last_row['id'] if older and last_row else None,
+                'prev_cursor': first_row['id'] if newer and first_row else None
+            }
+
+        # Rows are streamed as they are read; NULL columns are sent as null
+        return app.response_class(
+            stream_with_context(iter_json_rows(c, {'status': 'success'}, max_rows=max_rows, trailer=page_cursors)),
+            mimetype='application/json')
     except Exception as e:
         print(f"Error in admin_get_records: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'status': 'error', 'message': f'Error al cargar datos: {str(e)}'}), 500
 
+def backup_info(info):
+    return dict(info, created=info['created'].strftime('%Y-%m-%d %H:%M:%S'))
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request metrics in Prometheus text format (logged-in session or METRICS_TOKEN)."""
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(authorization, f'Bearer {METRICS_TOKEN}')
+    if 'user_id' not in session and not token_ok:
+        return jsonify({'status': 'error', 'message': 'No autorizado'}), 401
+
+    caches = {'analytics': analytics_cache, 'admin_count': admin_count_cache}
+    extra = {
+        'cache_hits_total': ('counter', 'Hits of the in-memory result caches.',
+                             {(('cache', name),): cache.hits for name, cache in caches.items()}),
+        'cache_misses_total': ('counter', 'Misses of the in-memory result caches.',
+                               {(('cache', name),): cache.misses for name, cache in caches.items()}),
+        'db_connections': ('gauge', 'Open pooled SQLite connections.', {(): len(_db_connections)}),
+    }
+    return app.response_class(request_metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+@login_required
+def admin_slow_queries():
+    """Top-N statement fingerprints by total, max, mean time or number of slow runs."""
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+        queries = slow_query_log.top(limit, request.args.get('sort', 'total'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'threshold_ms': SLOW_QUERY_MS, 'enabled': QUERY_TRACING,
+                    'data': queries})
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+@login_required
+def admin_reset_slow_queries():
+    slow_query_log.reset()
+    return jsonify({'status': 'success', 'message': 'Estadísticas reiniciadas'})
+
+@app.route('/api/admin/backups', methods=['GET'])
+@login_required
+def admin_list_backups():
+    return jsonify({'status': 'success', 'data': [backup_info(b) for b in backup_manager.list()]})
+
+@app.route('/api/admin/backups', methods=['POST'])
+@login_required
+def admin_create_backup():
+    try:
+        info = backup_manager.run_backup()
+        return jsonify({'status': 'success', 'message': 'Respaldo creado', 'data': backup_info(info)})
+    except Exception as e:
+        print(f"Error creating backup: {e}")
+        return jsonify({'status': 'error', 'message': f'Error al crear el respaldo: {e}'}), 500
+
+@app.route('/api/admin/export/xlsx', methods=['GET'])
+@login_required
+def admin_export_xlsx():
+    """Excel workbook with one sheet per table (?tables=, default all), filtered by sede and from/to."""
+    tables = [t for t in request.args.get('tables', ','.join(EXPORT_TABLES)).split(',') if t]
+    if not tables or any(t not in EXPORT_TABLES for t in tables):
+        return jsonify({'status': 'error', 'message': 'Tabla no permitida'}), 400
+    sede = request.args.get('sede')
+    try:
+        start, end = parse_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Rango de fechas inválido: {e}'}), 400
+
+    fd, path = tempfile.mkstemp(prefix='export_', suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_xlsx(get_db_connection(), path, tables, sede, start, end)
+        size = os.path.getsize(path)
+    except Exception as e:
+        remove_file(path)
+        print(f"Error generating xlsx export: {e}")
+        return jsonify({'status': 'error', 'message': f'Error al generar el Excel: {e}'}), 500
+
+    # The body removes the file when closed, also if it is never read (HEAD, aborted download)
+    response = app.response_class(
+        FileBody(path), direct_passthrough=True,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response.headers['Content-Length'] = str(size)
+    filename = export_filename('magical_hair', sede, start, end, 'xlsx')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/api/admin/<table_name>/export', methods=['GET'])
+@login_required
+def admin_export_table(table_name):
+    """Stream a whole table as CSV or NDJSON (?format=), filtered by sede and from/to."""
+    if table_name not in EXPORT_TABLES:
+        return jsonify({'status': 'error', 'message': 'Tabla no permitida'}), 400
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'status': 'error', 'message': 'Formato no soportado (csv o ndjson)'}), 400
+    sede = request.args.get('sede')
+    try:
+        start, end = parse_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Rango de fechas inválido: {e}'}), 400
+
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(*export_query(table_name, sede, start, end))
+
+    write_rows, mimetype = EXPORT_FORMATS[export_format]
+    response = app.response_class(stream_with_context(write_rows(c)), mimetype=mimetype)
+    filename = export_filename(table_name, sede, start, end, export_format)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @app.route('/api/admin/<table_name>/<id>', methods=['GET'])
 @login_required
 def admin_get_record(table_name, id):
@@ -1707,14 +1999,16 @@ def admin_get_record(table_name, id):
         
     try:
         conn = get_db_connection()
-        query = f"SELECT * FROM {table_name} WHERE id = ?"
-        df = pd.read_sql(query, conn, params=(id,))
+        c = conn.cursor()
+        c.execute(f"SELECT * FROM {table_name} WHERE id = ?", (id,))
+        row = c.fetchone()
+        columns = column_names(c)
         conn.close()
-        
-        if df.empty:
+
+        if row is None:
             return jsonify({'status': 'error', 'message': 'Registro no encontrado'}), 404
-            
-        return jsonify({'status': 'success', 'data': df.to_dict(orient='records')[0]})
+
+        return jsonify({'status': 'success', 'data': row_to_dict(row, columns)})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -1750,6 +2044,8 @@ def admin_update_record(table_name, id):
         params = list(data.values()) + [id]
         
         c.execute(query, params)
+        if table_name == 'servicios':
+            categorize_new_services(conn, [v for k, v in data.items() if k.lower() == 'servicio' and v])
         conn.commit()
         conn.close()
         
@@ -1776,4 +2072,5 @@ def admin_delete_record(table_name, id):
 
 if __name__ == '__main__':
     init_db()
+    start_background_warmup()
     app.run(host='0.0.0.0', debug=True)
@@ -1,13 +1,17 @@
 """
 Backup Script for Magical Hair Database
 Creates dated backups of database.db (siempre en la carpeta del ejecutable)
+
+Uses the same online backup as the app (backups.py): safe while the app is
+running, verified with integrity_check, and followed by the retention policy.
+The app also takes these backups on its own every BACKUP_INTERVAL_HOURS.
 """
 
 import sys
 import os
-import shutil
 from pathlib import Path
-from datetime import datetime
+
+from backups import BackupManager, BackupError
 
 # Carpeta del ejecutable o del script (misma carpeta que database.db)
 if getattr(sys, 'frozen', False):
@@ -24,19 +28,26 @@ BACKUP_FOLDER = PROJECT_DIR / "Backup"
 
 def create_backup():
     """Crea respaldo con fecha de database.db."""
-    today = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    
-    BACKUP_FOLDER.mkdir(exist_ok=True)
     print(f"Carpeta de respaldo: {BACKUP_FOLDER}")
-    
-    if SOURCE_DATABASE.exists():
-        backup_name = f"database_{today}.db"
-        backup_path = BACKUP_FOLDER / backup_name
-        shutil.copy2(SOURCE_DATABASE, backup_path)
-        print(f"Respaldo creado: {backup_path}")
-    else:
+
+    if not SOURCE_DATABASE.exists():
         print(f"Advertencia: {SOURCE_DATABASE} no encontrado.")
-    
+        return
+
+    manager = BackupManager(str(SOURCE_DATABASE), str(BACKUP_FOLDER),
+                            daily=int(os.environ.get('BACKUP_KEEP_DAILY', '7')),
+                            weekly=int(os.environ.get('BACKUP_KEEP_WEEKLY', '4')),
+                            monthly=int(os.environ.get('BACKUP_KEEP_MONTHLY', '12')))
+    try:
+        info = manager.run_backup()
+    except BackupError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Respaldo creado: {BACKUP_FOLDER / info['name']} (integridad: {info['integrity']})")
+    for name in info['deleted']:
+        print(f"Respaldo antiguo eliminado: {name}")
+
     print("\nRespaldo completado.")
 
 
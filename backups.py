@@ -0,0 +1,179 @@
+"""
+Online backups of database.db.
+
+Copies are taken with the SQLite backup API (sqlite3.Connection.backup) a few
+pages at a time, pausing between batches, so the app keeps reading and writing
+while a backup runs and the copy is always a consistent snapshot (copying the
+file with shutil could catch it mid-transaction). Each copy is checked with
+PRAGMA integrity_check before it is kept.
+
+Retention keeps the newest copy of each of the last N days, weeks and months;
+other copies named database_<fecha>.db in the folder are deleted. Other files
+in Backup/ (e.g. the old .xlsx exports) are never touched.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+BACKUP_PREFIX = 'database_'
+BACKUP_SUFFIX = '.db'
+BACKUP_NAME_FORMAT = '%Y-%m-%d_%H%M%S'
+
+
+class BackupError(Exception):
+    pass
+
+
+def backup_time(name):
+    """Timestamp encoded in a backup file name, or None if it is not one of ours."""
+    if not (name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)):
+        return None
+    stamp = name[len(BACKUP_PREFIX):-len(BACKUP_SUFFIX)]
+    for fmt in (BACKUP_NAME_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(stamp, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def list_backups(backup_dir):
+    """Backups in `backup_dir`, newest first: [{'name', 'created', 'size'}]."""
+    backups = []
+    try:
+        entries = list(os.scandir(backup_dir))
+    except OSError:
+        return backups
+    for entry in entries:
+        created = backup_time(entry.name)
+        if created and entry.is_file():
+            backups.append({'name': entry.name, 'created': created, 'size': entry.stat().st_size})
+    backups.sort(key=lambda b: b['created'], reverse=True)
+    return backups
+
+
+def verify_backup(path):
+    """Run PRAGMA integrity_check on a copy. Returns 'ok' or the first problem found."""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def create_backup(db_path, backup_dir, pages=256, pause=0.01):
+    """Copy `db_path` into `backup_dir` `pages` pages at a time and verify it. Returns its info."""
+    os.makedirs(backup_dir, exist_ok=True)
+    created = datetime.now().replace(microsecond=0)
+    while True:
+        name = f'{BACKUP_PREFIX}{created.strftime(BACKUP_NAME_FORMAT)}{BACKUP_SUFFIX}'
+        path = os.path.join(backup_dir, name)
+        if not os.path.exists(path):
+            break
+        # Two backups within the same second: never overwrite the first one
+        created += timedelta(seconds=1)
+    tmp_path = path + '.tmp'
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(tmp_path)
+    try:
+        # Pause after every batch so writers get the lock in between
+        source.backup(target, pages=pages, progress=lambda status, remaining, total: time.sleep(pause))
+        # The copy is a single self-contained file, not a WAL database
+        target.execute('PRAGMA journal_mode=DELETE')
+    except sqlite3.Error as e:
+        target.close()
+        os.remove(tmp_path)
+        raise BackupError(f'Error copiando la base de datos: {e}')
+    finally:
+        source.close()
+    target.close()
+
+    result = verify_backup(tmp_path)
+    if result != 'ok':
+        os.remove(tmp_path)
+        raise BackupError(f'La copia no pasó la verificación de integridad: {result}')
+    os.replace(tmp_path, path)
+    return {'name': name, 'created': created, 'size': os.path.getsize(path), 'integrity': result}
+
+
+def apply_retention(backup_dir, daily=7, weekly=4, monthly=12):
+    """Delete the backups not kept by the daily/weekly/monthly policy. Returns the deleted names."""
+    backups = list_backups(backup_dir)
+    keep = set()
+    for count, period in ((daily, lambda d: d.date()),
+                          (weekly, lambda d: d.isocalendar()[:2]),
+                          (monthly, lambda d: (d.year, d.month))):
+        seen = []
+        for backup in backups:  # newest first, so the first of each period is kept
+            key = period(backup['created'])
+            if key not in seen:
+                if len(seen) >= count:
+                    break
+                seen.append(key)
+                keep.add(backup['name'])
+
+    deleted = []
+    for backup in backups:
+        if backup['name'] not in keep:
+            try:
+                os.remove(os.path.join(backup_dir, backup['name']))
+                deleted.append(backup['name'])
+            except OSError as e:
+                print(f"Error eliminando respaldo {backup['name']}: {e}")
+    return deleted
+
+
+class BackupManager:
+    """Serializes backups (manual or scheduled) and runs the periodic scheduler thread."""
+
+    def __init__(self, db_path, backup_dir, interval_hours=24, pages=256, pause=0.01,
+                 daily=7, weekly=4, monthly=12):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval_hours * 3600
+        self.pages = pages
+        self.pause = pause
+        self.retention = {'daily': daily, 'weekly': weekly, 'monthly': monthly}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_backup(self):
+        """Take a backup now and apply retention. Returns the backup info plus what was deleted."""
+        with self._lock:
+            info = create_backup(self.db_path, self.backup_dir, pages=self.pages, pause=self.pause)
+            info['deleted'] = apply_retention(self.backup_dir, **self.retention)
+            return info
+
+    def list(self):
+        return list_backups(self.backup_dir)
+
+    def due(self):
+        backups = self.list()
+        if not backups:
+            return True
+        return (datetime.now() - backups[0]['created']).total_seconds() >= self.interval
+
+    def start(self):
+        """Start the scheduler thread (no-op if disabled or already running)."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='backup-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        # Check every few minutes; a restart does not trigger an extra copy if a recent one exists
+        while not self._stop.is_set():
+            try:
+                if self.due():
+                    info = self.run_backup()
+                    print(f"Respaldo automático creado: {info['name']}")
+            except Exception as e:
+                print(f"Error en el respaldo automático: {e}")
+            self._stop.wait(min(self.interval, 300))
@@ -0,0 +1,16 @@
+"""
+Benchmarks for Magical Hair.
+
+- generate_data.py fills a scratch database with seeded, realistic data (years
+  of servicios, productos, gastos, citas, inventario and gastos_mensuales for N
+  sedes and stylists).
+- run_benchmarks.py drives the routes through Flask's test client for each
+  dataset size and writes p50/p95/p99 latency and peak memory per endpoint to
+  a JSON report. Pass an older report with --baseline to compare releases.
+
+Usage (from the project folder):
+    python -m benchmarks.run_benchmarks --years 1 5 10 --output bench_report.json
+    python -m benchmarks.generate_data --years 5 --output /tmp/bench_5y.db
+
+These are measurements, not tests; nothing here touches database.db.
+"""
@@ -0,0 +1,196 @@
+"""
+Seeded synthetic data for benchmarks.
+
+The same arguments (and end date) always produce the same database. Volumes follow the shape
+of the real salons: busier Saturdays and Decembers, closed most Sundays, slow
+growth over the years, mostly cash payments, a few products and expenses a
+day, monthly fixed costs and an inventory of a couple hundred items per sede.
+
+    python -m benchmarks.generate_data --years 5 --sedes 3 --output /tmp/bench_5y.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+SEDE_NAMES = ['Bolivia', 'Garces Navas', 'Suba', 'Kennedy', 'Chapinero', 'Usaquen', 'Engativa', 'Fontibon']
+FIRST_NAMES = ['Monica', 'Sonia', 'Lorena', 'Mary', 'Aislen', 'Hiraida', 'Paola', 'Diana', 'Yesenia', 'Carolina',
+               'Andrea', 'Marcela', 'Johana', 'Sandra', 'Liliana', 'Viviana', 'Natalia', 'Camila', 'Jorge', 'Andres']
+LAST_NAMES = ['Gomez', 'Rodriguez', 'Martinez', 'Lopez', 'Garcia', 'Hernandez', 'Castellano', 'Rojas', 'Diaz',
+              'Moreno', 'Jimenez', 'Torres', 'Ramirez', 'Vargas', 'Suarez', 'Castro', 'Ortiz', 'Rubio']
+
+# (servicio, valor, relative frequency)
+SERVICES = [
+    ('Corte de Cabello Dama', 20000, 14), ('Corte de Cabello Hombre', 18000, 16), ('Cepillado', 22000, 10),
+    ('Shampoo Normal', 5000, 6), ('Shampoo Color', 7000, 3), ('Manicure', 16000, 12), ('Pedicure', 22000, 8),
+    ('Manicure Semipermanente', 35000, 6), ('Pedicure Semipermanente', 40000, 3),
+    ('Combo Manicure y Pedicure', 35000, 4), ('Retiro Semi Manos', 11000, 2), ('Tinte Base', 60000, 4),
+    ('Aplicacion Tinte', 25000, 3), ('Mechas', 180000, 1), ('keratina', 150000, 1), ('depilacion cejas', 10000, 6),
+    ('Depilacion Axilas', 15000, 1), ('Pigmentacion Cejas', 45000, 1), ('Peinado', 40000, 2), ('Barba', 10000, 4),
+    ('Planchado', 20000, 2), ('Tratamiento', 45000, 2), ('Maquillaje Secillo', 50000, 1),
+]
+PRODUCTS = [('TINTES', 'MARCELL', 12000), ('laca', 'SILUETA', 23000), ('texturizante', 'MARCELL', 42000),
+            ('SHAMPOO', 'KONZIL', 28000), ('ACONDICIONADOR', 'KONZIL', 30000), ('ESMALTE', 'MASGLO', 5600),
+            ('CERA', 'EGO', 18000), ('DECOLORANTE', 'ALFAPARF EVOLUTION', 6000)]
+PAYMENT_METHODS = [('Efectivo', 75), ('NEQUI', 18), ('Tarjeta', 5), ('Daviplata', 2)]
+EXPENSES = [('Bolsas', 8400), ('AROMATICAS', 12000), ('Ganchos', 1800), ('Azucar', 9100), ('Lavado Toallas', 30000),
+            ('Vasos', 6000), ('Marcador', 2500), ('Papel higienico', 15000), ('Algodon', 7000)]
+MONTHLY_EXPENSES = [('Arriendo Local', 1300000), ('Servicio de Agua', 90000), ('Servicio de Electricidad (Codensa)', 160000),
+                    ('Servicio de Internet y TV (Claro)', 110000), ('Cuota Banco (Davivienda)', 450000)]
+INVENTORY_UNITS = ['Unidad', 'und', 'ml', 'gr']
+
+# Weekday load (lunes..domingo) and monthly load (enero..diciembre)
+WEEKDAY_LOAD = [0.8, 0.8, 0.9, 1.0, 1.3, 1.7, 0.25]
+MONTH_LOAD = [0.85, 0.9, 0.95, 0.95, 1.0, 1.05, 1.0, 0.95, 0.95, 1.0, 1.1, 1.45]
+
+
+def _weighted(rng, items):
+    """Pick an item by its last field (the weight); returns the other fields."""
+    choices = [item[:-1] if len(item) > 2 else item[0] for item in items]
+    return rng.choices(choices, weights=[item[-1] for item in items])[0]
+
+
+def _unique_name(names, i):
+    """names[i], numbered once the list runs out ('Suba 2')."""
+    name = names[i % len(names)]
+    return name if i < len(names) else f'{name} {i // len(names) + 1}'
+
+
+def _clock(rng, day):
+    """Random business-hours timestamp on `day`."""
+    seconds = rng.randint(8 * 3600, 19 * 3600)
+    return (datetime.combine(day, datetime.min.time()) + timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _person(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'.upper()
+
+
+def generate(path, years=1, sedes=2, stylists=5, daily_services=20, seed=1234, end=None):
+    """Create `path` with the app schema and `years` of data ending at `end` (default today).
+
+    Returns {table: rows}. An existing file at `path` is replaced.
+    """
+    from app import create_schema
+
+    rng = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=round(365.25 * years))
+    sede_names = [_unique_name(SEDE_NAMES, i) for i in range(sedes)]
+    staff = {sede: [(_unique_name(FIRST_NAMES, j * stylists + i), rng.choice((40, 50, 50, 50)))
+                    for i in range(stylists)]
+             for j, sede in enumerate(sede_names)}
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    create_schema(conn)
+    c = conn.cursor()
+    c.executemany('INSERT OR IGNORE INTO sedes (nombre) VALUES (?)', [(s,) for s in sede_names])
+    c.executemany('INSERT OR IGNORE INTO estilistas (nombre, comision, comision_especial) VALUES (?, ?, ?)',
+                  [(name, rate, rate) for people in staff.values() for name, rate in people])
+    conn.commit()
+
+    counts = dict.fromkeys(('servicios', 'productos', 'gastos', 'citas', 'inventario', 'gastos_mensuales'), 0)
+    total_days = (end - start).days
+    day = start
+    while day <= end:
+        servicios, productos, gastos, citas = [], [], [], []
+        # Slow growth: the last year is ~40% busier than the first
+        growth = 0.7 + 0.4 * (day - start).days / max(total_days, 1)
+        load = WEEKDAY_LOAD[day.weekday()] * MONTH_LOAD[day.month - 1] * growth
+        for sede in sede_names:
+            if day.weekday() == 6 and rng.random() < 0.7:
+                continue  # most sedes close on Sunday
+            for _ in range(max(0, round(rng.gauss(daily_services * load, daily_services * load * 0.25)))):
+                stylist, rate = rng.choice(staff[sede])
+                servicio, valor = _weighted(rng, SERVICES)
+                if rng.random() < 0.1:
+                    valor = round(valor * rng.uniform(0.8, 1.5), -3)
+                cliente = _person(rng) if rng.random() < 0.3 else None
+                servicios.append((sede, _clock(rng, day), stylist, servicio, float(valor), valor * rate / 100,
+                                  _weighted(rng, PAYMENT_METHODS), cliente))
+            for _ in range(rng.choices((0, 1, 2, 3), weights=(40, 35, 18, 7))[0]):
+                stylist, _rate = rng.choice(staff[sede])
+                producto, marca, valor = rng.choice(PRODUCTS)
+                productos.append((sede, _clock(rng, day), stylist, producto, marca, producto.lower(),
+                                  float(valor), valor * 0.1, _weighted(rng, PAYMENT_METHODS), None))
+            for _ in range(rng.choices((0, 1, 2), weights=(55, 35, 10))[0]):
+                descripcion, valor = rng.choice(EXPENSES)
+                gastos.append((sede, _clock(rng, day), descripcion, float(round(valor * rng.uniform(0.7, 1.4), -2))))
+            for _ in range(rng.choices((0, 1, 2, 3, 4), weights=(30, 30, 20, 12, 8))[0]):
+                estado = 'Pendiente' if day >= end else rng.choice(('Completada', 'Completada', 'Cancelada'))
+                citas.append((str(uuid.UUID(int=rng.getrandbits(128), version=4)), sede, day.strftime('%Y-%m-%d'),
+                              f'{rng.randint(8, 18):02d}:{rng.choice((0, 15, 30, 45)):02d}', _person(rng),
+                              f'3{rng.randint(100000000, 299999999)}', _weighted(rng, SERVICES)[0], '', estado))
+
+        c.executemany('''INSERT INTO servicios (sede, fecha, estilista, servicio, valor, comision, metodo_pago, cliente)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', servicios)
+        c.executemany('''INSERT INTO productos (sede, fecha, estilista, producto, marca, descripcion, valor, comision, metodo_pago, cliente)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', productos)
+        c.executemany('INSERT INTO gastos (sede, fecha, descripcion, valor) VALUES (?, ?, ?, ?)', gastos)
+        c.executemany('''INSERT INTO citas (id, sede, fecha, hora, cliente, telefono, servicio, notas, estado)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', citas)
+        counts['servicios'] += len(servicios)
+        counts['productos'] += len(productos)
+        counts['gastos'] += len(gastos)
+        counts['citas'] += len(citas)
+
+        if day.day == 1:
+            mes = day.strftime('%Y-%m')
+            rows = [(sede, mes, tipo, float(valor), _clock(rng, day)) for sede in sede_names for tipo, valor in MONTHLY_EXPENSES]
+            c.executemany('INSERT INTO gastos_mensuales (sede, mes, tipo, valor, fecha_registro) VALUES (?, ?, ?, ?, ?)', rows)
+            counts['gastos_mensuales'] += len(rows)
+            conn.commit()
+        day += timedelta(days=1)
+
+    # Upcoming appointments for the agenda
+    citas = [(str(uuid.UUID(int=rng.getrandbits(128), version=4)), sede, (end + timedelta(days=rng.randint(1, 30))).strftime('%Y-%m-%d'),
+              f'{rng.randint(8, 18):02d}:00', _person(rng), f'3{rng.randint(100000000, 299999999)}',
+              _weighted(rng, SERVICES)[0], '', 'Pendiente')
+             for sede in sede_names for _ in range(40)]
+    c.executemany('''INSERT INTO citas (id, sede, fecha, hora, cliente, telefono, servicio, notas, estado)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', citas)
+    counts['citas'] += len(citas)
+
+    inventario = []
+    for sede in sede_names:
+        for i in range(200):
+            producto, marca, valor = rng.choice(PRODUCTS)
+            cantidad = rng.randint(0, 12)
+            actualizado = _clock(rng, end - timedelta(days=rng.randint(0, 365))) if rng.random() < 0.8 else ''
+            inventario.append((sede, producto, marca, f'{producto.lower()} {i}', float(cantidad),
+                               rng.choice(INVENTORY_UNITS), float(valor),
+                               'Agotado' if cantidad == 0 else rng.choice(('Nuevo', 'Usado')), actualizado))
+    c.executemany('''INSERT INTO inventario (sede, producto, marca, descripcion, cantidad, unidad, valor, estado, fecha_actualizacion)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', inventario)
+    counts['inventario'] += len(inventario)
+    conn.commit()
+    conn.execute('PRAGMA optimize')
+    conn.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera una base de datos sintética para benchmarks.')
+    parser.add_argument('--output', required=True, help='archivo .db a crear (se reemplaza si existe)')
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--sedes', type=int, default=2)
+    parser.add_argument('--stylists', type=int, default=5, help='estilistas por sede')
+    parser.add_argument('--daily-services', type=int, default=20, help='servicios en un día normal por sede')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    begin = time.perf_counter()
+    counts = generate(args.output, args.years, args.sedes, args.stylists, args.daily_services, args.seed)
+    print(f"{args.output}: {', '.join(f'{t} {n}' for t, n in counts.items())} "
+          f"({time.perf_counter() - begin:.1f} s)")
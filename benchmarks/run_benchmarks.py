@@ -0,0 +1,343 @@
+"""
+Endpoint benchmarks over synthetic datasets.
+
+For every dataset size a scratch database is generated (generate_data.py) and
+a separate Python process drives the routes in SCENARIOS through Flask's test
+client, so each size starts cold (imports, caches, connections) and memory
+numbers do not leak between sizes. Per endpoint the report has:
+
+- first_ms: the first request (cold imports and caches)
+- p50_ms / p95_ms / p99_ms / mean_ms over `iterations` timed requests
+- peak_kb: peak Python allocations during one request (tracemalloc, measured
+  in a separate pass so its overhead does not skew the latencies)
+- bytes and status of the response
+
+Scenarios marked cold clear the analytics and admin count caches before each
+request; their "(cache)" twin measures the cached path. The write scenarios run
+last. Logout, deletes, manual backups and the async PDF jobs are left out: they
+change the session or the files around the database rather than the data.
+
+    python -m benchmarks.run_benchmarks --years 1 5 10 --output bench_report.json
+    python -m benchmarks.run_benchmarks --years 1 --baseline bench_report.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+ITERATIONS = 20
+MEMORY_SAMPLES = 3
+# Ratio over the baseline p50 reported as a regression
+REGRESSION_RATIO = 1.2
+
+SEDE = 'Bolivia'
+STYLIST = 'Monica'
+
+# (name, method, url, options). URLs are formatted with {sede}, {today}, {month},
+# {month_start}; options: cold, iterations (cap for slow exports), json (POST body).
+SCENARIOS = [
+    ('login page', 'GET', '/login', {}),
+    ('index', 'GET', '/', {}),
+    ('admin page', 'GET', '/admin', {}),
+    ('certificado', 'GET', '/certificado', {}),
+    ('stylists', 'GET', '/api/stylists', {}),
+    ('services', 'GET', '/api/services', {}),
+    ('sedes', 'GET', '/api/sedes', {}),
+    ('users', 'GET', '/api/users', {}),
+    ('service categories', 'GET', '/api/service-categories', {}),
+    ('summary', 'GET', '/api/summary?date={today}&sede={sede}', {}),
+    ('statistics', 'GET', '/api/statistics?month={month}&sede={sede}', {}),
+    ('statistics all sedes', 'GET', '/api/statistics?month={month}', {}),
+    ('statistics 10 years', 'GET', '/api/statistics?month={month}&sede={sede}&years=10', {}),
+    ('prediction', 'GET', '/api/prediction?sede={sede}', {'cold': True}),
+    ('prediction (cache)', 'GET', '/api/prediction?sede={sede}', {}),
+    ('revenue patterns', 'GET', '/api/revenue-patterns?sede={sede}', {'cold': True}),
+    ('revenue patterns (cache)', 'GET', '/api/revenue-patterns?sede={sede}', {}),
+    ('service demand', 'GET', '/api/service-demand?sede={sede}', {'cold': True}),
+    ('service demand (cache)', 'GET', '/api/service-demand?sede={sede}', {}),
+    ('inventory', 'GET', '/api/inventory?sede={sede}', {}),
+    ('appointments', 'GET', '/api/appointments?sede={sede}&date={today}', {}),
+    ('alerts', 'GET', '/api/alerts', {}),
+    ('monthly expenses', 'GET', '/api/monthly-expenses?sede={sede}&mes={month}', {}),
+    ('admin servicios', 'GET', '/api/admin/servicios?limit=100', {'cold': True}),
+    ('admin servicios (cache)', 'GET', '/api/admin/servicios?limit=100', {}),
+    ('admin servicios sede', 'GET', '/api/admin/servicios?limit=100&sede={sede}', {'cold': True}),
+    ('admin servicios offset 5000', 'GET', '/api/admin/servicios?limit=100&offset=5000', {}),
+    ('admin citas', 'GET', '/api/admin/citas?limit=100&sede={sede}', {}),
+    ('admin record', 'GET', '/api/admin/servicios/1', {}),
+    ('admin backups', 'GET', '/api/admin/backups', {}),
+    ('export csv month', 'GET', '/api/admin/servicios/export?format=csv&sede={sede}&from={month_start}&to={today}', {}),
+    ('export csv all', 'GET', '/api/admin/servicios/export?format=csv', {'iterations': 5}),
+    ('export ndjson all', 'GET', '/api/admin/servicios/export?format=ndjson', {'iterations': 5}),
+    ('export xlsx month', 'GET', '/api/admin/export/xlsx?sede={sede}&from={month_start}&to={today}', {'iterations': 5}),
+    ('day pdf', 'GET', '/export_pdf?date={today}&sede={sede}', {'iterations': 5}),
+    ('certificado pdf', 'GET', '/certificado/descargar', {'iterations': 5}),
+    ('add service', 'POST', '/api/service', {'json': {'sede': SEDE, 'estilista': STYLIST, 'servicio': 'Manicure',
+                                                      'valor': 16000, 'metodo_pago': 'Efectivo'}}),
+    ('add expense', 'POST', '/api/expense', {'json': {'sede': SEDE, 'descripcion': 'Bolsas', 'valor': 8400}}),
+    ('add appointment', 'POST', '/api/appointment', {'json': {'sede': SEDE, 'fecha': '{today}', 'hora': '10:00',
+                                                              'cliente': 'CLIENTE PRUEBA', 'telefono': '3000000000',
+                                                              'servicio': 'Cepillado'}}),
+    ('checkout', 'POST', '/api/checkout', {'json': {'sede': SEDE, 'metodo_pago': 'NEQUI', 'items': [
+        {'tipo': 'servicio', 'estilista': STYLIST, 'servicio': 'Cepillado', 'valor': 22000},
+        {'tipo': 'producto', 'estilista': STYLIST, 'producto': 'laca', 'valor': 23000}]}}),
+]
+
+
+def percentile(values, p):
+    """p-th percentile (0-100) of a sorted list, interpolating between ranks."""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def _fill(value, params):
+    if isinstance(value, str):
+        return value.format(**params)
+    if isinstance(value, dict):
+        return {k: _fill(v, params) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, params) for v in value]
+    return value
+
+
+# ── Worker: runs inside a fresh process against one database ──
+
+def run_scenarios(db_path, iterations=ITERATIONS, only=None):
+    """Drive SCENARIOS against `db_path` and return {name: stats}."""
+    import app as app_module
+    from backups import BackupManager
+    from pdf_exports import PdfExportQueue
+
+    # Point the app at the scratch database; PDFs, backups and the slow-query log go to a temp folder
+    scratch = tempfile.mkdtemp(prefix='bench_')
+    app_module.DB_FILE = db_path
+    app_module.pdf_exports = PdfExportQueue(os.path.join(scratch, 'pdf_cache'))
+    app_module.backup_manager = BackupManager(db_path, os.path.join(scratch, 'Backup'), interval_hours=0)
+    app_module.slow_query_log.path = os.path.join(scratch, 'slow_queries.log')
+
+    def clear_caches():
+        app_module.analytics_cache.clear()
+        app_module.admin_count_cache.clear()
+
+    today = date.today()
+    params = {'sede': SEDE, 'today': today.strftime('%Y-%m-%d'), 'month': today.strftime('%Y-%m'),
+              'month_start': today.replace(day=1).strftime('%Y-%m-%d')}
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'admin'
+
+    def call(method, url, body):
+        response = client.open(url, method=method, json=body)
+        data = response.get_data()
+        response.close()
+        return response.status_code, len(data)
+
+    results = {}
+    for name, method, url, options in SCENARIOS:
+        if only and name not in only:
+            continue
+        url = _fill(url, params)
+        body = _fill(options.get('json'), params)
+        cold = options.get('cold', False)
+        count = min(iterations, options.get('iterations', iterations))
+
+        if cold:
+            clear_caches()
+        start = time.perf_counter()
+        status, size = call(method, url, body)
+        first_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        statuses = {}
+        for _ in range(count):
+            if cold:
+                clear_caches()
+            start = time.perf_counter()
+            status, size = call(method, url, body)
+            timings.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        peak = 0
+        tracemalloc.start()
+        for _ in range(min(MEMORY_SAMPLES, count)):
+            if cold:
+                clear_caches()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call(method, url, body)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+
+        timings.sort()
+        results[name] = {
+            'method': method,
+            'url': url,
+            'status': {str(code): n for code, n in statuses.items()},
+            'bytes': size,
+            'iterations': count,
+            'first_ms': round(first_ms, 3),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+    app_module.slow_query_log.close()
+    shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+# ── Driver: generates the datasets and collects the workers' results ──
+
+def dataset_path(data_dir, years, sedes, stylists, seed, end):
+    return os.path.join(data_dir, f'bench_{years:g}y_{sedes}s_{stylists}e_{seed}_{end:%Y%m%d}.db')
+
+
+def run_dataset(db_path, iterations, only=None):
+    """Run the scenarios in a fresh interpreter and return its results."""
+    fd, output = tempfile.mkstemp(suffix='.json', prefix='bench_')
+    os.close(fd)
+    try:
+        command = [sys.executable, '-m', 'benchmarks.run_benchmarks', '--worker', db_path,
+                   '--worker-output', output, '--iterations', str(iterations)]
+        for name in only or ():
+            command += ['--only', name]
+        # The app's own prints (schema, errors) are not part of the report
+        subprocess.run(command, cwd=BASE_DIR, check=True, stdout=subprocess.DEVNULL)
+        with open(output, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(dataset):
+    print(f"\n── {dataset['years']:g} años · {dataset['rows']['servicios']} servicios ──")
+    print(f"{'endpoint':32} {'first':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'peak KB':>9}  status")
+    for name, r in dataset['endpoints'].items():
+        print(f"{name:32} {r['first_ms']:9.1f} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} "
+              f"{r['peak_kb']:9.0f}  {','.join(r['status'])}")
+
+
+def compare(report, baseline):
+    """Print p50/p95 against a previous report. Returns the regressions found."""
+    regressions = []
+    old = {d['years']: d for d in baseline.get('datasets', [])}
+    for dataset in report['datasets']:
+        before = old.get(dataset['years'])
+        if not before:
+            continue
+        print(f"\n── {dataset['years']:g} años vs {baseline.get('git_commit') or 'baseline'} ──")
+        print(f"{'endpoint':32} {'p50 antes':>10} {'p50 ahora':>10} {'ratio':>7} {'p95 antes':>10} {'p95 ahora':>10}")
+        for name, r in dataset['endpoints'].items():
+            b = before['endpoints'].get(name)
+            if not b:
+                continue
+            ratio = r['p50_ms'] / b['p50_ms'] if b['p50_ms'] else float('inf')
+            flag = '  <-- más lento' if ratio > REGRESSION_RATIO else ''
+            print(f"{name:32} {b['p50_ms']:10.1f} {r['p50_ms']:10.1f} {ratio:7.2f} {b['p95_ms']:10.1f} {r['p95_ms']:10.1f}{flag}")
+            if flag:
+                regressions.append((dataset['years'], name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de los endpoints sobre datos sintéticos.')
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5, 10], help='tamaños de los datos en años')
+    parser.add_argument('--sedes', type=int, default=2)
+    parser.add_argument('--stylists', type=int, default=5, help='estilistas por sede')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--only', action='append', help='solo este escenario (se puede repetir)')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'magical_hair_bench'),
+                        help='carpeta de las bases generadas (se reutilizan si ya existen)')
+    parser.add_argument('--regenerate', action='store_true', help='generar las bases aunque existan')
+    parser.add_argument('--output', default='bench_report.json')
+    parser.add_argument('--baseline', help='reporte anterior con el que comparar')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        results = run_scenarios(args.worker, args.iterations, args.only)
+        with open(args.worker_output, 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+        return 0
+
+    from benchmarks.generate_data import generate
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    end = date.today()
+    report = {
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'sedes': args.sedes, 'stylists': args.stylists, 'seed': args.seed,
+                     'iterations': args.iterations, 'end': end.isoformat()},
+        'datasets': [],
+    }
+    for years in args.years:
+        path = dataset_path(args.data_dir, years, args.sedes, args.stylists, args.seed, end)
+        counts_path = path + '.json'
+        if args.regenerate or not (os.path.exists(path) and os.path.exists(counts_path)):
+            print(f"Generando {years:g} años de datos en {path}...")
+            counts = generate(path, years, args.sedes, args.stylists, seed=args.seed, end=end)
+            with open(counts_path, 'w', encoding='utf-8') as f:
+                json.dump(counts, f)
+        with open(counts_path, encoding='utf-8') as f:
+            counts = json.load(f)
+
+        # Each size runs on a copy: the write scenarios must not change the cached dataset
+        fd, copy = tempfile.mkstemp(suffix='.db', prefix='bench_run_')
+        os.close(fd)
+        try:
+            shutil.copyfile(path, copy)
+            print(f"Midiendo {years:g} años...")
+            endpoints = run_dataset(copy, args.iterations, args.only)
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(copy + suffix):
+                    os.remove(copy + suffix)
+        dataset = {'years': years, 'rows': counts, 'db_size_kb': round(os.path.getsize(path) / 1024),
+                   'endpoints': endpoints}
+        report['datasets'].append(dataset)
+        print_results(dataset)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nReporte guardado en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f))
+        if regressions:
+            print(f"\n{len(regressions)} endpoint(s) más de {REGRESSION_RATIO:g}x más lentos que la base.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Stylist, service, sede and user catalogs stored in SQLite.
+
+These used to live in stylists.json, services.json, sedes.json and users.json
+and were rewritten whole on every change. Each catalog is now a table with a
+unique key, so edits are single-row statements. Every write bumps the table's
+counter in catalog_versions (via triggers); app.py uses it to know when its
+in-memory copy is stale.
+
+servicio_categorias maps every service name ever recorded (catalog or not) to
+its demand category. Names get a default from categorize_service() when they
+are written (app.py) or, for rows imported by other tools, at startup; admins
+can then change it.
+
+The JSON files are imported once, when the tables are first created. Run this
+file directly to import them again (existing entries are kept):
+    python catalogs.py
+"""
+import json
+import os
+
+CATALOG_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS estilistas (
+                    id INTEGER PRIMARY KEY,
+                    nombre TEXT NOT NULL UNIQUE,
+                    comision REAL NOT NULL DEFAULT 50,
+                    comision_especial REAL NOT NULL DEFAULT 50
+                );''',
+    '''CREATE TABLE IF NOT EXISTS catalogo_servicios (
+                    id INTEGER PRIMARY KEY,
+                    nombre TEXT NOT NULL UNIQUE,
+                    valor REAL NOT NULL DEFAULT 0
+                );''',
+    '''CREATE TABLE IF NOT EXISTS sedes (
+                    id INTEGER PRIMARY KEY,
+                    nombre TEXT NOT NULL UNIQUE
+                );''',
+    '''CREATE TABLE IF NOT EXISTS usuarios (
+                    username TEXT PRIMARY KEY,
+                    password_hash TEXT NOT NULL
+                );''',
+    '''CREATE TABLE IF NOT EXISTS servicio_categorias (
+                    servicio TEXT PRIMARY KEY,
+                    categoria TEXT NOT NULL
+                );''',
+    '''CREATE TABLE IF NOT EXISTS catalog_versions (
+                    tabla TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                );''',
+]
+
+CATALOG_TABLES = ('estilistas', 'catalogo_servicios', 'sedes', 'usuarios', 'servicio_categorias')
+
+# Categories charted by /api/service-demand; anything else is 'Otros'
+DEMAND_CATEGORIES = ['Corte', 'Tintura', 'Uñas', 'Depilación']
+SERVICE_CATEGORIES = DEMAND_CATEGORIES + ['Otros']
+
+# First matching rule wins
+CATEGORY_KEYWORDS = [
+    ('Corte', ('corte',)),
+    ('Tintura', ('tinte', 'mechas', 'color', 'iluminaciones', 'keratina')),
+    ('Uñas', ('manicure', 'pedicure', 'uñas', 'semi')),
+    ('Depilación', ('depilacion', 'cejas', 'cera', 'bigote')),
+]
+
+
+def categorize_service(name):
+    """Default category of a service name, from keywords in it."""
+    name = str(name).lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in name for keyword in keywords):
+            return category
+    return 'Otros'
+
+
+def _version_triggers(table):
+    bump = f'''INSERT INTO catalog_versions (tabla, version) VALUES ('{table}', 1)
+                ON CONFLICT (tabla) DO UPDATE SET version = version + 1;'''
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        yield f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+            BEGIN
+                {bump}
+            END;'''
+
+
+def create_catalog_schema(conn, stylists_file, services_file, sedes_file, users_file):
+    """Create the catalog tables. Imports the JSON files the first time."""
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'estilistas'")
+    is_new = c.fetchone() is None
+
+    for statement in CATALOG_SCHEMA:
+        c.execute(statement)
+    for table in CATALOG_TABLES:
+        for statement in _version_triggers(table):
+            c.execute(statement)
+    conn.commit()
+
+    if is_new:
+        import_json_catalogs(conn, stylists_file, services_file, sedes_file, users_file)
+    # Names without a category: the first time, or rows added by the importer
+    c.execute('''SELECT nombre FROM catalogo_servicios
+                 WHERE nombre NOT IN (SELECT servicio FROM servicio_categorias)
+                 UNION
+                 SELECT s.servicio FROM servicios s LEFT JOIN servicio_categorias m ON m.servicio = s.servicio
+                 WHERE m.servicio IS NULL''')
+    categorize_new_services(conn, [row[0] for row in c.fetchall()])
+    conn.commit()
+
+
+def _read_json(path, encoding=None):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding=encoding) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error leyendo {path}: {e}")
+        return None
+
+
+def import_json_catalogs(conn, stylists_file, services_file, sedes_file, users_file):
+    """Copy the legacy JSON catalogs into SQLite in one transaction.
+
+    Entries that already exist are left untouched, so this can be re-run.
+    Returns the number of rows inserted per table.
+    """
+    imported = {}
+    c = conn.cursor()
+
+    stylists = _read_json(stylists_file) or []
+    rows = []
+    for s in stylists:
+        # Oldest format: plain list of names
+        if isinstance(s, str):
+            s = {'name': s}
+        rows.append((s['name'], float(s.get('commission', 50)), float(s.get('special_commission', 50))))
+    c.executemany('INSERT OR IGNORE INTO estilistas (nombre, comision, comision_especial) VALUES (?, ?, ?)', rows)
+    imported['estilistas'] = c.rowcount
+
+    services = _read_json(services_file) or []
+    rows = []
+    for s in services:
+        if isinstance(s, str):
+            s = {'name': s}
+        rows.append((s['name'], float(s.get('value', 0))))
+    c.executemany('INSERT OR IGNORE INTO catalogo_servicios (nombre, valor) VALUES (?, ?)', rows)
+    imported['catalogo_servicios'] = c.rowcount
+
+    sedes = _read_json(sedes_file, encoding='utf-8')
+    if sedes is None:
+        # Same default the JSON version used when sedes.json was missing
+        sedes = ['Principal']
+    c.executemany('INSERT OR IGNORE INTO sedes (nombre) VALUES (?)', [(s,) for s in sedes])
+    imported['sedes'] = c.rowcount
+
+    users = _read_json(users_file) or {}
+    c.executemany('INSERT OR IGNORE INTO usuarios (username, password_hash) VALUES (?, ?)', list(users.items()))
+    imported['usuarios'] = c.rowcount
+
+    conn.commit()
+    return imported
+
+
+def catalog_version(conn, table):
+    """Change counter of a catalog table (0 if it was never written)."""
+    c = conn.cursor()
+    c.execute('SELECT version FROM catalog_versions WHERE tabla = ?', (table,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+def categorize_new_services(conn, names):
+    """Store the default category of the names that do not have one yet. The caller commits."""
+    c = conn.cursor()
+    c.executemany('INSERT OR IGNORE INTO servicio_categorias (servicio, categoria) VALUES (?, ?)',
+                  [(name, categorize_service(name)) for name in set(names) if name is not None])
+    return c.rowcount
+
+
+def list_stylists(conn):
+    c = conn.cursor()
+    c.execute('SELECT nombre, comision, comision_especial FROM estilistas ORDER BY id')
+    return [{'name': row[0], 'commission': row[1], 'special_commission': row[2]} for row in c.fetchall()]
+
+
+def list_services(conn):
+    c = conn.cursor()
+    c.execute('SELECT nombre, valor FROM catalogo_servicios ORDER BY id')
+    return [{'name': row[0], 'value': row[1]} for row in c.fetchall()]
+
+
+def list_service_categories(conn):
+    c = conn.cursor()
+    c.execute('SELECT servicio, categoria FROM servicio_categorias ORDER BY servicio')
+    return dict(c.fetchall())
+
+
+def list_sedes(conn):
+    c = conn.cursor()
+    c.execute('SELECT nombre FROM sedes ORDER BY id')
+    return [row[0] for row in c.fetchall()]
+
+
+def list_users(conn):
+    c = conn.cursor()
+    c.execute('SELECT username, password_hash FROM usuarios ORDER BY rowid')
+    return dict(c.fetchall())
+
+
+if __name__ == '__main__':
+    from app import get_db_connection, init_db, STYLISTS_FILE, SERVICES_FILE, SEDES_FILE, USERS_FILE
+    init_db()
+    conn = get_db_connection()
+    result = import_json_catalogs(conn, STYLISTS_FILE, SERVICES_FILE, SEDES_FILE, USERS_FILE)
+    conn.close()
+    print(f"Catálogos importados: {result}")
@@ -0,0 +1,70 @@
+"""
+Day summary (cierre del día) shared by /api/summary and /export_pdf.
+
+Services and products of one day and sede are read with one UNION ALL query,
+and the totals (expenses included) with a small aggregate query, so nothing is
+summed in Python and no DataFrame is built.
+"""
+
+DAY_ITEMS_SQL = '''
+    SELECT 'servicios' AS sheet, id, estilista, servicio AS descripcion,
+           IFNULL(valor, 0) AS valor, IFNULL(comision, 0) AS comision,
+           'Servicio' AS tipo, IFNULL(metodo_pago, 'N/A') AS metodo_pago, 0 AS orden
+    FROM servicios
+    WHERE sede = :sede AND fecha >= :day_start AND fecha < :day_end
+    UNION ALL
+    SELECT 'productos', id, estilista, producto,
+           IFNULL(valor, 0), IFNULL(comision, 0),
+           'Producto', IFNULL(metodo_pago, 'N/A'), 1
+    FROM productos
+    WHERE sede = :sede AND fecha >= :day_start AND fecha < :day_end
+    ORDER BY orden, id
+'''
+
+DAY_TOTALS_SQL = '''
+    SELECT IFNULL(SUM(valor), 0) AS valor,
+           IFNULL(SUM(comision), 0) AS comision,
+           IFNULL(SUM(gasto), 0) AS gastos
+    FROM (
+        SELECT valor, comision, NULL AS gasto FROM servicios
+        WHERE sede = :sede AND fecha >= :day_start AND fecha < :day_end
+        UNION ALL
+        SELECT valor, comision, NULL FROM productos
+        WHERE sede = :sede AND fecha >= :day_start AND fecha < :day_end
+        UNION ALL
+        SELECT NULL, NULL, valor FROM gastos
+        WHERE sede = :sede AND fecha >= :day_start AND fecha < :day_end
+    )
+'''
+
+
+def build_day_summary(conn, sede, day_start, day_end):
+    """Line items and totals for one sede in [day_start, day_end).
+
+    Returns (rows, totals). Rows are services and products; expenses only count
+    towards totals['gastos'].
+    """
+    params = {'sede': sede, 'day_start': day_start, 'day_end': day_end}
+    c = conn.cursor()
+    c.execute(DAY_ITEMS_SQL, params)
+    rows = [{
+        'id': item_id,
+        'sheet': sheet,
+        'estilista': estilista,
+        'descripcion': descripcion,
+        'valor': float(valor),
+        'comision': float(comision),
+        'tipo': tipo,
+        'metodo_pago': metodo_pago
+    } for sheet, item_id, estilista, descripcion, valor, comision, tipo, metodo_pago, _orden in c.fetchall()]
+
+    c.execute(DAY_TOTALS_SQL, params)
+    total_valor, total_comision, total_gastos = (float(value) for value in c.fetchone())
+    totals = {
+        'valor': total_valor,
+        'comision': total_comision,
+        'gastos': total_gastos,
+        # Profit: Net Sales - Expenses - Commissions
+        'utilidad': total_valor - total_gastos - total_comision
+    }
+    return rows, totals
@@ -0,0 +1,183 @@
+"""
+Streaming exports of the admin tables.
+
+Rows are read from the SQLite cursor in chunks and written out as they come,
+so exporting years of records uses the same memory as exporting a day and the
+first bytes leave before the query has finished.
+
+Excel files cannot be sent before they are complete (an .xlsx is a zip), so
+write_xlsx() feeds the rows into an openpyxl write-only workbook, which spools
+each sheet to disk, and the finished file is then streamed and deleted.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+EXPORT_TABLES = ['servicios', 'productos', 'gastos', 'inventario', 'citas', 'gastos_mensuales']
+
+# Column each table is filtered by in a date range
+DATE_COLUMNS = {
+    'inventario': 'fecha_actualizacion',
+    'gastos_mensuales': 'mes',
+}
+
+CHUNK_SIZE = 1000
+
+
+def parse_range(date_from, date_to):
+    """Validate inclusive 'YYYY-MM-DD' bounds (either may be empty). Raises ValueError."""
+    start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+    end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    if start and end and start > end:
+        raise ValueError('La fecha inicial es posterior a la final')
+    return start, end
+
+
+def export_query(table, sede=None, start=None, end=None):
+    """SELECT for `table` filtered by sede and the inclusive day range [start, end]."""
+    column = DATE_COLUMNS.get(table, 'fecha')
+    where, params = [], []
+    if sede:
+        where.append('sede = ?')
+        params.append(sede)
+    if column == 'mes':
+        # Monthly rows: every month touched by the range
+        if start:
+            where.append('mes >= ?')
+            params.append(start.strftime('%Y-%m'))
+        if end:
+            where.append('mes <= ?')
+            params.append(end.strftime('%Y-%m'))
+    else:
+        if start:
+            where.append(f'{column} >= ?')
+            params.append(start.strftime('%Y-%m-%d'))
+        elif end:
+            # Rows without a date are outside any range
+            where.append(f"{column} > ''")
+        if end:
+            where.append(f'{column} < ?')
+            params.append((end + timedelta(days=1)).strftime('%Y-%m-%d'))
+
+    query = f'SELECT * FROM {table}'
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    return query + ' ORDER BY id', params
+
+
+def iter_csv(cursor, chunk_size=CHUNK_SIZE):
+    """CSV text chunks: header, then rows. Starts with a BOM so Excel reads the accents."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column[0] for column in cursor.description])
+    yield '\ufeff' + buffer.getvalue()
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def iter_ndjson(cursor, chunk_size=CHUNK_SIZE):
+    """One JSON object per line."""
+    columns = [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+                      for row in rows)
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
+
+
+# Text columns written to Excel as real dates when they parse
+XLSX_DATE_COLUMNS = ('fecha', 'fecha_actualizacion', 'fecha_registro')
+
+
+def _xlsx_value(value, is_date, illegal_chars):
+    if isinstance(value, str):
+        if is_date:
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        # Control characters make openpyxl refuse the cell
+        return illegal_chars.sub('', value)
+    return value
+
+
+def write_xlsx(conn, path, tables, sede=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """Write one sheet per table (same filters as export_query) to `path`."""
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = Workbook(write_only=True)
+    c = conn.cursor()
+    for table in tables:
+        sheet = workbook.create_sheet(title=table)
+        c.execute(*export_query(table, sede, start, end))
+        columns = [column[0] for column in c.description]
+        date_flags = [column in XLSX_DATE_COLUMNS for column in columns]
+        sheet.append(columns)
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                sheet.append([_xlsx_value(value, is_date, ILLEGAL_CHARACTERS_RE)
+                              for value, is_date in zip(row, date_flags)])
+    workbook.save(path)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class FileBody:
+    """Response body that sends a file in chunks and removes it once closed.
+
+    The WSGI server closes the body whether or not it was read (HEAD requests,
+    clients gone before the first chunk), so the file never stays behind.
+    """
+
+    def __init__(self, path, chunk_size=64 * 1024, delete=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.delete = delete
+        self.closed = False
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.delete:
+            remove_file(self.path)
+
+
+def export_filename(name, sede, start, end, extension):
+    parts = [name, sede or 'todas']
+    if start or end:
+        parts.append(f"{start or 'inicio'}_{end or 'hoy'}")
+    return '_'.join(str(p).replace(' ', '_') for p in parts) + '.' + extension
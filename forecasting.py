@@ -0,0 +1,328 @@
+"""
+Incremental income forecast for /api/prediction.
+
+`forecast_state` keeps, per sede, the least-squares sums (n, Σx, Σx², Σy, Σxy)
+of daily income over the closed days (before today) of the last
+FORECAST_WINDOW_DAYS days; `forecast_weekdays` keeps the income per day of the
+week over the same days. When a day closes its income is added and the day
+leaving the window is subtracted, so the state moves forward in O(1) per day.
+A forecast only adds today's partial income and evaluates the line.
+
+Daily income is read from daily_totals (see rollups.py). x is the day number
+counted from EPOCH, which keeps the sums small enough to stay exact. Edits to
+days already folded into the state mark it dirty (triggers). A forecast never
+writes: it advances or rebuilds a stale state in memory, and
+refresh_forecast_state(), run in the background by app.py, stores it.
+
+Run this file directly to rebuild the state of every sede in one pass:
+    python forecasting.py
+"""
+from datetime import date, timedelta
+
+FORECAST_WINDOW_DAYS = 330
+FORECAST_HORIZON_DAYS = 7
+EPOCH = date(2000, 1, 1)
+# strftime('%w') numbering (0 = domingo) of EPOCH
+EPOCH_DOW = EPOCH.isoweekday() % 7
+# Weekdays never seen after this many data points are taken as closed days
+MIN_POINTS_FOR_SEASONALITY = 14
+
+FORECAST_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS forecast_state (
+                    sede TEXT PRIMARY KEY,
+                    ultimo_dia TEXT NOT NULL,
+                    ultimo_dato INTEGER,
+                    n INTEGER NOT NULL DEFAULT 0,
+                    sum_x INTEGER NOT NULL DEFAULT 0,
+                    sum_xx INTEGER NOT NULL DEFAULT 0,
+                    sum_y REAL NOT NULL DEFAULT 0,
+                    sum_xy REAL NOT NULL DEFAULT 0,
+                    dirty INTEGER NOT NULL DEFAULT 0
+                );''',
+    '''CREATE TABLE IF NOT EXISTS forecast_weekdays (
+                    sede TEXT NOT NULL,
+                    dow INTEGER NOT NULL,
+                    n INTEGER NOT NULL DEFAULT 0,
+                    sum_y REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (sede, dow)
+                ) WITHOUT ROWID;''',
+]
+
+FORECAST_SOURCES = ('servicios', 'productos')
+
+STATE_COLUMNS = ('sede', 'ultimo_dia', 'ultimo_dato', 'n', 'sum_x', 'sum_xx', 'sum_y', 'sum_xy', 'dirty')
+
+
+def _dirty_sql(ref):
+    return f'''UPDATE forecast_state SET dirty = 1
+                WHERE sede = IFNULL({ref}.sede, '') AND ultimo_dia >= date({ref}.fecha);'''
+
+
+def create_forecast_schema(conn):
+    """Create the forecast tables and the triggers that invalidate them."""
+    c = conn.cursor()
+    for statement in FORECAST_SCHEMA:
+        c.execute(statement)
+    for table in FORECAST_SOURCES:
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_forecast_insert AFTER INSERT ON {table}
+            BEGIN
+                {_dirty_sql('NEW')}
+            END;''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_forecast_delete AFTER DELETE ON {table}
+            BEGIN
+                {_dirty_sql('OLD')}
+            END;''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_forecast_update AFTER UPDATE ON {table}
+            BEGIN
+                {_dirty_sql('OLD')}
+                {_dirty_sql('NEW')}
+            END;''')
+    conn.commit()
+
+
+def day_number(day):
+    return day.toordinal() - EPOCH.toordinal()
+
+
+def day_from_number(x):
+    return EPOCH + timedelta(days=int(x))
+
+
+def _daily_income(c, start, end, sede=None):
+    """[(sede, x, income)] for days with sales in [start, end), ordered by sede and day."""
+    sede_sql, params = (' AND sede = ?', [sede]) if sede is not None else ('', [])
+    c.execute(f'''SELECT sede, CAST(julianday(dia) - julianday(?) AS INTEGER),
+                         SUM(ventas_servicios + ventas_productos)
+                  FROM daily_totals
+                  WHERE dia >= ? AND dia < ?{sede_sql}
+                  GROUP BY sede, dia
+                  HAVING SUM(num_servicios + num_productos) > 0
+                  ORDER BY sede, dia''',
+              [EPOCH.isoformat(), start.isoformat(), end.isoformat()] + params)
+    return c.fetchall()
+
+
+def _read_state(c, sede):
+    c.execute(f'SELECT {", ".join(STATE_COLUMNS)} FROM forecast_state WHERE sede = ?', (sede,))
+    row = c.fetchone()
+    return dict(zip(STATE_COLUMNS, row)) if row else None
+
+
+def _read_weekdays(c, sede):
+    """{dow: [n, sum_y]} for the 7 days of the week."""
+    weekdays = {dow: [0, 0.0] for dow in range(7)}
+    c.execute('SELECT dow, n, sum_y FROM forecast_weekdays WHERE sede = ?', (sede,))
+    for dow, n, sum_y in c.fetchall():
+        weekdays[dow] = [n, sum_y]
+    return weekdays
+
+
+def _compute(c, today, sede=None):
+    """{sede: (state, weekdays)} of one sede (or all) from daily_totals, in one vectorized pass. Reads only."""
+    import numpy as np
+
+    rows = _daily_income(c, today - timedelta(days=FORECAST_WINDOW_DAYS), today, sede)
+    sedes = sorted({row[0] for row in rows} | ({sede} if sede is not None else set()))
+    if not sedes:
+        return {}
+
+    m = len(sedes)
+    index = {s: i for i, s in enumerate(sedes)}
+    codes = np.array([index[row[0]] for row in rows], dtype=np.int64)
+    x = np.array([row[1] for row in rows], dtype=np.int64)
+    y = np.array([row[2] for row in rows], dtype=np.float64)
+
+    n = np.bincount(codes, minlength=m)
+    sum_x = np.bincount(codes, weights=x, minlength=m)
+    sum_xx = np.bincount(codes, weights=x * x, minlength=m)
+    sum_y = np.bincount(codes, weights=y, minlength=m)
+    sum_xy = np.bincount(codes, weights=x * y, minlength=m)
+    last = np.full(m, -1, dtype=np.int64)
+    np.maximum.at(last, codes, x)
+
+    cells = codes * 7 + (x + EPOCH_DOW) % 7
+    dow_n = np.bincount(cells, minlength=m * 7).reshape(m, 7)
+    dow_y = np.bincount(cells, weights=y, minlength=m * 7).reshape(m, 7)
+
+    ultimo_dia = (today - timedelta(days=1)).isoformat()
+    return {s: ({'sede': s, 'ultimo_dia': ultimo_dia, 'ultimo_dato': int(last[i]) if n[i] else None,
+                 'n': int(n[i]), 'sum_x': int(sum_x[i]), 'sum_xx': int(sum_xx[i]),
+                 'sum_y': float(sum_y[i]), 'sum_xy': float(sum_xy[i]), 'dirty': 0},
+                {dow: [int(dow_n[i, dow]), float(dow_y[i, dow])] for dow in range(7)})
+            for i, s in enumerate(sedes)}
+
+
+def _store(c, state, weekdays):
+    c.execute(f'''INSERT OR REPLACE INTO forecast_state ({", ".join(STATE_COLUMNS)})
+                  VALUES ({", ".join("?" for _ in STATE_COLUMNS)})''',
+              [state[column] for column in STATE_COLUMNS])
+    c.executemany('INSERT OR REPLACE INTO forecast_weekdays (sede, dow, n, sum_y) VALUES (?, ?, ?, ?)',
+                  [(state['sede'], dow, n, sum_y) for dow, (n, sum_y) in weekdays.items()])
+
+
+def _rebuild(c, today, sede=None):
+    """Recompute and store the state of one sede (or all)."""
+    states = _compute(c, today, sede)
+    if sede is None:
+        c.execute('DELETE FROM forecast_state')
+        c.execute('DELETE FROM forecast_weekdays')
+    else:
+        c.execute('DELETE FROM forecast_state WHERE sede = ?', (sede,))
+        c.execute('DELETE FROM forecast_weekdays WHERE sede = ?', (sede,))
+    for state, weekdays in states.values():
+        _store(c, state, weekdays)
+    return len(states)
+
+
+def rebuild_forecast_state(conn, today, sede=None):
+    """Rebuild the forecast state from daily_totals in one transaction."""
+    try:
+        count = _rebuild(conn.cursor(), today, sede)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def _advance(c, state, weekdays, today):
+    """The state with the days closed since its last update folded in and the ones that left the window dropped."""
+    sede = state['sede']
+    folded_end = date.fromisoformat(state['ultimo_dia']) + timedelta(days=1)
+    added = _daily_income(c, folded_end, today, sede)
+    expired = _daily_income(c, folded_end - timedelta(days=FORECAST_WINDOW_DAYS),
+                            today - timedelta(days=FORECAST_WINDOW_DAYS), sede)
+
+    state = dict(state)
+    weekdays = {dow: list(values) for dow, values in weekdays.items()}
+    for rows, sign in ((added, 1), (expired, -1)):
+        for _, x, y in rows:
+            state['n'] += sign
+            state['sum_x'] += sign * x
+            state['sum_xx'] += sign * x * x
+            state['sum_y'] += sign * y
+            state['sum_xy'] += sign * x * y
+            weekdays[(x + EPOCH_DOW) % 7][0] += sign
+            weekdays[(x + EPOCH_DOW) % 7][1] += sign * y
+
+    state['ultimo_dato'] = max([state['ultimo_dato'] or -1] + [row[1] for row in added])
+    if state['n'] <= 0:
+        state['ultimo_dato'] = None
+    state['ultimo_dia'] = (today - timedelta(days=1)).isoformat()
+    return state, weekdays
+
+
+def _is_current(state, today):
+    return state is not None and not state['dirty'] and state['ultimo_dia'] == (today - timedelta(days=1)).isoformat()
+
+
+def _bring_up_to_date(c, state, sede, today):
+    """(state, weekdays) of `sede` covering every closed day up to yesterday, computed without writing."""
+    if _is_current(state, today):
+        return state, _read_weekdays(c, sede)
+    if (state is None or state['dirty'] or state['ultimo_dia'] >= today.isoformat()
+            or date.fromisoformat(state['ultimo_dia']) < today - timedelta(days=FORECAST_WINDOW_DAYS)):
+        computed = _compute(c, today, sede)
+        return computed[sede]
+    return _advance(c, state, _read_weekdays(c, sede), today)
+
+
+def load_forecast_state(conn, sede, today):
+    """(state, weekdays) of `sede` up to yesterday. Only reads: a stale stored state is
+    advanced or rebuilt in memory, and refresh_forecast_state() stores it later."""
+    c = conn.cursor()
+    return _bring_up_to_date(c, _read_state(c, sede), sede, today)
+
+
+def refresh_forecast_state(conn, today):
+    """Store the up-to-date state of every sede whose state is stale or missing.
+
+    Runs off the request path (app.py's background refresher), so /api/prediction
+    never takes SQLite's write lock. Returns the number of sedes updated.
+    """
+    c = conn.cursor()
+    c.execute('''SELECT DISTINCT sede FROM daily_totals WHERE dia >= ?
+                 UNION SELECT sede FROM forecast_state''',
+              ((today - timedelta(days=FORECAST_WINDOW_DAYS)).isoformat(),))
+    sedes = [row[0] for row in c.fetchall()]
+    stale = [sede for sede in sedes if not _is_current(_read_state(c, sede), today)]
+    if not stale:
+        return 0
+
+    # Take the write lock before re-reading so two refreshes do not fold the same day twice
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        for sede in stale:
+            state = _read_state(c, sede)
+            if not _is_current(state, today):
+                _store(c, *_bring_up_to_date(c, state, sede, today))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(stale)
+
+
+def income_history(conn, sede, today):
+    """Daily income of the window including today: [{'fecha', 'valor'}]."""
+    rows = _daily_income(conn.cursor(), today - timedelta(days=FORECAST_WINDOW_DAYS),
+                         today + timedelta(days=1), sede)
+    return [{'fecha': day_from_number(x).isoformat(), 'valor': float(y)} for _, x, y in rows]
+
+
+def forecast(conn, sede, today, horizon=FORECAST_HORIZON_DAYS):
+    """Linear trend with day-of-week factors over the window, evaluated in constant time.
+
+    Returns None when the window has no sales, else {'prediction', 'trend', 'slope'}.
+    """
+    state, weekdays = load_forecast_state(conn, sede, today)
+    c = conn.cursor()
+    n, sum_x, sum_xx = state['n'], state['sum_x'], state['sum_xx']
+    sum_y, sum_xy, last = state['sum_y'], state['sum_xy'], state['ultimo_dato']
+
+    # Today is still open: add its income without storing it
+    for _, x, y in _daily_income(c, today, today + timedelta(days=1), sede):
+        n, sum_x, sum_xx, sum_y, sum_xy = n + 1, sum_x + x, sum_xx + x * x, sum_y + y, sum_xy + x * y
+        weekdays[(x + EPOCH_DOW) % 7][0] += 1
+        weekdays[(x + EPOCH_DOW) % 7][1] += y
+        last = x
+    if n <= 0 or last is None:
+        return None
+
+    # Simple Linear Regression: y = mx + b
+    denominator = n * sum_xx - sum_x ** 2
+    if n > 1 and denominator != 0:
+        slope = (n * sum_xy - sum_x * sum_y) / denominator
+        intercept = (sum_y - slope * sum_x) / n
+    else:
+        slope = 0
+        intercept = sum_y / n
+
+    # Seasonal factor: mean income of the weekday relative to the overall mean
+    mean_y = sum_y / n
+    factors = {}
+    for dow, (dow_n, dow_y) in weekdays.items():
+        if dow_n > 0 and mean_y > 0:
+            factors[dow] = (dow_y / dow_n) / mean_y
+        else:
+            factors[dow] = 0.0 if n >= MIN_POINTS_FOR_SEASONALITY else 1.0
+
+    predictions = []
+    for x in range(last + 1, last + 1 + horizon):
+        pred_value = max(0, (slope * x + intercept) * factors[(x + EPOCH_DOW) % 7])
+        predictions.append({'fecha': day_from_number(x).isoformat(), 'valor': float(pred_value)})
+
+    return {
+        'prediction': predictions,
+        'trend': 'up' if slope > 0 else 'down' if slope < 0 else 'stable',
+        'slope': slope
+    }
+
+
+if __name__ == '__main__':
+    from app import get_db_connection, init_db
+    init_db()
+    conn = get_db_connection()
+    count = rebuild_forecast_state(conn, date.today())
+    conn.close()
+    print(f"forecast_state reconstruida: {count} sedes.")
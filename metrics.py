@@ -0,0 +1,283 @@
+"""
+Request metrics in Prometheus text format.
+
+RequestMetrics keeps, per (method, route), the number of requests by status,
+and histograms of latency, response size and time spent in SQLite. Routes are
+the URL rules ('/api/admin/<table_name>'), not the URLs, so the number of
+series stays fixed. app.py feeds it from before_request/after_request and
+serves render() at /api/metrics.
+
+SQL time is measured by TimedCursor: PooledConnection hands it out for every
+cursor (conn.execute included), and it adds the time of each execute and fetch
+to a per-thread counter that the request hooks reset and read. The same cursor
+reports finished statements to the slow-query log (query_log.py).
+"""
+import sqlite3
+import threading
+import time
+
+PREFIX = 'magical_hair_'
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_sql_local = threading.local()
+_statement_observer = None
+
+
+def start_sql_timer():
+    """Start counting SQL time on this thread (called when a request begins)."""
+    _sql_local.seconds = 0.0
+    _sql_local.queries = 0
+
+
+def sql_time():
+    """(seconds, statements) spent in SQLite on this thread since start_sql_timer()."""
+    return getattr(_sql_local, 'seconds', 0.0), getattr(_sql_local, 'queries', 0)
+
+
+def set_statement_observer(observer):
+    """Report every finished statement as observer(cursor, sql, parameters, many, seconds); None stops it."""
+    global _statement_observer
+    _statement_observer = observer
+
+
+def _add_sql_time(seconds, queries=0):
+    if hasattr(_sql_local, 'seconds'):
+        _sql_local.seconds += seconds
+        _sql_local.queries += queries
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds the time of every execute and fetch to the thread's SQL timer.
+
+    SQLite does most of the work while rows are stepped, so fetches are timed
+    as well, not only execute(). Timing is per call, not per row: iterating
+    the cursor reads it in timed fetchmany() chunks of ITER_CHUNK rows and
+    sqlite3's own row stepping is not overridden, so draining 200k rows stays
+    within about 10% of a plain cursor. fetchone() is timed on every call; it
+    is meant for single rows, not for draining a table. With a statement
+    observer set, each statement's total is reported once it is done: no
+    result rows, last row fetched, next execute, close() or the cursor being
+    dropped.
+    """
+    ITER_CHUNK = 256
+    _statement = None
+
+    def _start_statement(self, sql, parameters, many):
+        if self._statement is not None:
+            self._end_statement()
+        if _statement_observer is not None:
+            self._statement = [sql, parameters, many, 0.0]
+
+    def _spent(self, seconds, queries=0):
+        _add_sql_time(seconds, queries)
+        if self._statement is not None:
+            self._statement[3] += seconds
+
+    def _end_statement(self):
+        statement, self._statement = self._statement, None
+        observer = _statement_observer
+        if statement is not None and observer is not None:
+            observer(self, *statement)
+
+    def _run(self, method, sql, parameters, many):
+        self._start_statement(sql, parameters, many)
+        start = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            self._spent(time.perf_counter() - start, 1)
+            if many or self.description is None:
+                self._end_statement()  # nothing to fetch (INSERT, UPDATE, DDL...)
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, True)
+
+    def executescript(self, sql_script):
+        self._start_statement(sql_script, (), False)
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._spent(time.perf_counter() - start, 1)
+            self._end_statement()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            row = super().fetchone()
+        finally:
+            self._spent(time.perf_counter() - start)
+        if row is None:
+            self._end_statement()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        try:
+            rows = super().fetchmany(size)
+        finally:
+            self._spent(time.perf_counter() - start)
+        if len(rows) < size:
+            self._end_statement()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._spent(time.perf_counter() - start)
+            self._end_statement()
+
+    def __iter__(self):
+        # A generator, so rows already read in a chunk are not seen by a later
+        # fetch; every caller here reads the whole result set
+        while True:
+            start = time.perf_counter()
+            try:
+                rows = super().fetchmany(self.ITER_CHUNK)
+            finally:
+                self._spent(time.perf_counter() - start)
+            yield from rows
+            if len(rows) < self.ITER_CHUNK:
+                self._end_statement()
+                return
+
+    def close(self):
+        self._end_statement()
+        super().close()
+
+    def __del__(self):
+        if self._statement is not None:
+            try:
+                self._end_statement()
+            except Exception:
+                pass
+
+
+class Histogram:
+    """Cumulative-bucket histogram (not thread-safe; RequestMetrics locks around it)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        """Prometheus lines: cumulative _bucket{le=...}, _sum and _count."""
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}'
+        yield f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}'
+        yield f'{name}_sum{_labels(labels)} {_number(self.sum)}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}' if items else ''
+
+
+class _RouteStats:
+    def __init__(self):
+        self.status = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.sql = Histogram(LATENCY_BUCKETS)
+        self.sql_queries = 0
+
+
+class RequestMetrics:
+    """Thread-safe per-route request statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.in_flight = 0
+        self.started = time.time()
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def observe(self, method, route, status, seconds, size, sql_seconds=0.0, sql_queries=0):
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = _RouteStats()
+            stats.status[status] = stats.status.get(status, 0) + 1
+            stats.latency.observe(seconds)
+            stats.size.observe(size)
+            stats.sql.observe(sql_seconds)
+            stats.sql_queries += sql_queries
+
+    def render(self, extra=None):
+        """All metrics in Prometheus text exposition format (0.0.4).
+
+        `extra` adds other series: {name: (type, help, {label tuple: value})},
+        e.g. the hits of the result caches.
+        """
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+
+            name = PREFIX + 'http_requests_total'
+            lines += [f'# HELP {name} Requests handled, by route and status code.', f'# TYPE {name} counter']
+            for (method, route), stats in routes:
+                for status, n in sorted(stats.status.items()):
+                    lines.append(f'{name}{_labels({"method": method, "route": route, "status": status})} {n}')
+
+            for metric, attribute, help_text in (
+                    ('http_request_duration_seconds', 'latency', 'Time until the response body was sent.'),
+                    ('http_response_size_bytes', 'size', 'Size of the response body.'),
+                    ('http_request_sql_seconds', 'sql', 'Time spent in SQLite (execute and fetch) per request.')):
+                name = PREFIX + metric
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (method, route), stats in routes:
+                    lines += getattr(stats, attribute).samples(name, {'method': method, 'route': route})
+
+            name = PREFIX + 'http_request_sql_queries_total'
+            lines += [f'# HELP {name} SQL statements executed, by route.', f'# TYPE {name} counter']
+            for (method, route), stats in routes:
+                lines.append(f'{name}{_labels({"method": method, "route": route})} {stats.sql_queries}')
+
+            name = PREFIX + 'http_requests_in_flight'
+            lines += [f'# HELP {name} Requests being handled right now.', f'# TYPE {name} gauge',
+                      f'{name} {self.in_flight}']
+
+        name = PREFIX + 'process_start_time_seconds'
+        lines += [f'# HELP {name} Start time of the process (Unix time).', f'# TYPE {name} gauge',
+                  f'{name} {_number(round(self.started, 3))}']
+
+        for metric, (kind, help_text, series) in (extra or {}).items():
+            name = PREFIX + metric
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for labels, value in series.items():
+                lines.append(f'{name}{_labels(dict(labels))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
@@ -1,14 +1,52 @@
+"""
+Import Excel workbooks (database.xlsx, or the historic files of a new sede) into database.db.
 
-import sqlite3
-import pandas as pd
+The workbook is read with openpyxl in read-only mode and inserted in chunks of
+CHUNK_SIZE rows, each chunk in its own transaction, so memory stays flat however
+large the file is.
+
+- Resumable: import_checkpoints records, per workbook (identified by the hash of
+  its content) and sheet, the last row committed. Running the same file again
+  continues after that row, and finished sheets are skipped.
+- Idempotent: every imported row leaves its content hash in import_hashes. Rows
+  already imported, from this or any other workbook, are skipped. Rows that are
+  in the table without a hash (written by the app, or by the old pandas
+  migration) are found by comparing the row with the table and skipped too.
+  Identical rows repeated inside one sheet are kept as many times as they
+  appear; the occurrence number is part of the hash.
+
+Usage:
+    python migrate_to_sqlite.py [archivo.xlsx ...] [--sede NOMBRE] [--chunk-size N]
+"""
+import argparse
+import hashlib
 import os
-import sys
+import sqlite3
+from datetime import date, datetime, time
 
 # Define file paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 EXCEL_FILE = os.path.join(BASE_DIR, 'database.xlsx')
 DB_FILE = os.path.join(BASE_DIR, 'database.db')
 
+CHUNK_SIZE = 1000
+
+# Sheet -> table, in import order. Citas and GastosMensuales are optional.
+SHEETS = [
+    ('Servicios', 'servicios', True),
+    ('Productos', 'productos', True),
+    ('Gastos', 'gastos', True),
+    ('Inventario', 'inventario', True),
+    ('Citas', 'citas', False),
+    ('GastosMensuales', 'gastos_mensuales', False),
+]
+
+# Columns stored as 'YYYY-MM-DD' (the app writes appointment dates without time)
+DATE_ONLY_COLUMNS = {('citas', 'fecha')}
+
+# Bound parameters per "IN (...)" lookup (older SQLite builds allow 999)
+LOOKUP_BATCH = 500
+
 def create_connection(db_file):
     """Create a database connection to the SQLite database specified by db_file."""
     conn = None
@@ -23,7 +61,7 @@ def create_tables(conn):
     """Create tables in the SQLite database."""
     try:
         c = conn.cursor()
-        
+
         # Servicios
         c.execute('''CREATE TABLE IF NOT EXISTS servicios (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -33,9 +71,10 @@ def create_tables(conn):
                         servicio TEXT,
                         valor REAL,
                         comision REAL,
-                        metodo_pago TEXT
+                        metodo_pago TEXT,
+                        cliente TEXT
                     );''')
-                    
+
         # Productos
         c.execute('''CREATE TABLE IF NOT EXISTS productos (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -47,7 +86,8 @@ def create_tables(conn):
                         descripcion TEXT,
                         valor REAL,
                         comision REAL,
-                        metodo_pago TEXT
+                        metodo_pago TEXT,
+                        cliente TEXT
                     );''')
 
         # Gastos
@@ -95,81 +135,244 @@ def create_tables(conn):
                         valor REAL,
                         fecha_registro TIMESTAMP
                     );''')
-        
+
+        # Import bookkeeping
+        c.execute('''CREATE TABLE IF NOT EXISTS import_checkpoints (
+                        origen TEXT NOT NULL,
+                        hoja TEXT NOT NULL,
+                        archivo TEXT,
+                        fila INTEGER NOT NULL DEFAULT 1,
+                        insertadas INTEGER NOT NULL DEFAULT 0,
+                        omitidas INTEGER NOT NULL DEFAULT 0,
+                        completado INTEGER NOT NULL DEFAULT 0,
+                        actualizado TEXT,
+                        PRIMARY KEY (origen, hoja)
+                    );''')
+        c.execute('''CREATE TABLE IF NOT EXISTS import_hashes (
+                        tabla TEXT NOT NULL,
+                        hash BLOB NOT NULL,
+                        PRIMARY KEY (tabla, hash)
+                    ) WITHOUT ROWID;''')
+        # Occurrences of each row content seen so far in a sheet being imported
+        # (deleted when the sheet is finished)
+        c.execute('''CREATE TABLE IF NOT EXISTS import_ocurrencias (
+                        origen TEXT NOT NULL,
+                        hoja TEXT NOT NULL,
+                        hash BLOB NOT NULL,
+                        n INTEGER NOT NULL,
+                        PRIMARY KEY (origen, hoja, hash)
+                    ) WITHOUT ROWID;''')
+
         conn.commit()
         print("Tables created successfully.")
     except Exception as e:
         print(f"Error creating tables: {e}")
 
-def migrate_data():
-    if not os.path.exists(EXCEL_FILE):
-        print(f"Error: {EXCEL_FILE} not found.")
+def file_hash(path, block_size=1024 * 1024):
+    """sha256 of the file content: identifies a workbook whatever its name."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+def to_db_value(value, date_only=False):
+    """Excel cell value as the app stores it."""
+    if isinstance(value, datetime):
+        if date_only:
+            return value.strftime('%Y-%m-%d')
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    if isinstance(value, str):
+        value = value.strip()
+        return value if value else None
+    return value
+
+def row_hash(values):
+    """Content hash of a row. 18000 and 18000.0 hash the same."""
+    normalized = [float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v
+                  for v in values]
+    return hashlib.blake2b(repr(normalized).encode('utf-8'), digest_size=16).digest()
+
+def _lookup(conn, query, params, keys):
+    """Run `query` (ending in 'IN ({})') for `keys` in batches; yields result rows."""
+    keys = list(keys)
+    for i in range(0, len(keys), LOOKUP_BATCH):
+        batch = keys[i:i + LOOKUP_BATCH]
+        yield from conn.execute(query.format(', '.join('?' * len(batch))), params + batch)
+
+def count_in_table(conn, table, columns, values):
+    """Rows of `table` equal to `values` (empty cells match NULL or '', as older imports stored them)."""
+    conditions = []
+    params = []
+    for column, value in zip(columns, values):
+        if value is None:
+            conditions.append(f"({column} IS NULL OR {column} = '')")
+        else:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {' AND '.join(conditions)}", params).fetchone()[0]
+
+def import_chunk(conn, origen, sheet, table, columns, rows):
+    """Insert the rows not imported before. Returns (inserted, skipped). Does not commit."""
+    hashes = [row_hash(row) for row in rows]
+
+    # Occurrence number of each row content inside this sheet
+    seen = dict(_lookup(conn, 'SELECT hash, n FROM import_ocurrencias WHERE origen = ? AND hoja = ? AND hash IN ({})',
+                        [origen, sheet], set(hashes)))
+    keys = []
+    occurrences = []
+    for h in hashes:
+        seen[h] = seen.get(h, 0) + 1
+        occurrences.append(seen[h])
+        keys.append(h if seen[h] == 1 else h + seen[h].to_bytes(4, 'big'))
+
+    existing = {row[0] for row in _lookup(conn, 'SELECT hash FROM import_hashes WHERE tabla = ? AND hash IN ({})',
+                                          [table], keys)}
+
+    # Rows without a hash may still be in the table (app writes, old migration):
+    # the n-th copy of a row is new only if the table has fewer than n of them
+    in_table = {}
+    for row, h, key in zip(rows, hashes, keys):
+        if key not in existing and h not in in_table:
+            in_table[h] = count_in_table(conn, table, columns, row)
+
+    new_rows = []
+    new_keys = []
+    for row, h, key, n in zip(rows, hashes, keys, occurrences):
+        if key in existing:
+            continue
+        if n > in_table[h]:
+            new_rows.append(row)
+        new_keys.append((table, key))  # found in the table: hashed now, skipped next time
+
+    # OR IGNORE: a cita whose id is already in the table is kept as it is
+    conn.executemany(f'''INSERT OR IGNORE INTO {table} ({', '.join(columns)})
+                         VALUES ({', '.join('?' * len(columns))})''', new_rows)
+    conn.executemany('INSERT INTO import_hashes (tabla, hash) VALUES (?, ?)', new_keys)
+    conn.executemany('''INSERT INTO import_ocurrencias (origen, hoja, hash, n) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (origen, hoja, hash) DO UPDATE SET n = excluded.n''',
+                     [(origen, sheet, h, n) for h, n in seen.items()])
+    return len(new_rows), len(rows) - len(new_rows)
+
+def import_sheet(conn, workbook, path, origen, sheet, table, chunk_size=CHUNK_SIZE, default_sede=None):
+    """Import one sheet from its checkpoint onwards, committing every `chunk_size` rows."""
+    c = conn.cursor()
+    c.execute('SELECT fila, insertadas, omitidas, completado FROM import_checkpoints WHERE origen = ? AND hoja = ?',
+              (origen, sheet))
+    checkpoint = c.fetchone()
+    if checkpoint and checkpoint[3]:
+        print(f"  {sheet}: ya importada ({checkpoint[1]} filas nuevas, {checkpoint[2]} repetidas).")
         return
+    last_row, inserted, skipped = checkpoint[:3] if checkpoint else (1, 0, 0)
+    if checkpoint:
+        print(f"  {sheet}: reanudando después de la fila {last_row}.")
 
-    conn = create_connection(DB_FILE)
+    worksheet = workbook[sheet]
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None) or ()
+    # Excel columns: Sede, Fecha, Estilista, ...  Table columns: sede, fecha, estilista, ...
+    names = [str(h).strip().lower().replace(' ', '_') if h is not None else None for h in header]
+    known = set(table_columns(conn, table))
+    unknown = [n for n in names if n and n not in known]
+    if unknown:
+        print(f"  {sheet}: columnas ignoradas: {', '.join(unknown)}")
+    positions = [(i, n) for i, n in enumerate(names) if n in known]
+    columns = [n for _, n in positions]
+    add_sede = default_sede and 'sede' not in columns
+    if add_sede:
+        columns.append('sede')
+    date_only = [(table, n) in DATE_ONLY_COLUMNS for n in columns]
+    sede_index = columns.index('sede') if 'sede' in columns else None
+
+    def save_progress(row_number, done=False):
+        c.execute('''INSERT INTO import_checkpoints (origen, hoja, archivo, fila, insertadas, omitidas, completado, actualizado)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (origen, hoja) DO UPDATE SET
+                        archivo = excluded.archivo, fila = excluded.fila, insertadas = excluded.insertadas,
+                        omitidas = excluded.omitidas, completado = excluded.completado, actualizado = excluded.actualizado''',
+                  (origen, sheet, os.path.basename(path), row_number, inserted, skipped, int(done),
+                   datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    chunk = []
+    row_number = 1  # header
+    for row_number, raw in enumerate(rows, start=2):
+        if row_number <= last_row:
+            continue  # committed by a previous run
+        values = [to_db_value(raw[i] if i < len(raw) else None, flag)
+                  for (i, _), flag in zip(positions, date_only)]
+        if add_sede:
+            values.append(None)
+        if all(v is None for v in values):
+            continue  # blank line
+        if sede_index is not None and values[sede_index] is None and default_sede:
+            values[sede_index] = default_sede
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            new, repeated = import_chunk(conn, origen, sheet, table, columns, chunk)
+            inserted += new
+            skipped += repeated
+            save_progress(row_number)
+            conn.commit()
+            chunk = []
+            print(f"  {sheet}: fila {row_number} ({inserted} nuevas, {skipped} repetidas)")
+
+    if chunk:
+        new, repeated = import_chunk(conn, origen, sheet, table, columns, chunk)
+        inserted += new
+        skipped += repeated
+    c.execute('DELETE FROM import_ocurrencias WHERE origen = ? AND hoja = ?', (origen, sheet))
+    save_progress(max(row_number, last_row), done=True)
+    conn.commit()
+    print(f"  {sheet}: {inserted} filas nuevas, {skipped} repetidas.")
+
+def migrate_data(path=EXCEL_FILE, db_file=DB_FILE, chunk_size=CHUNK_SIZE, default_sede=None):
+    if not os.path.exists(path):
+        print(f"Error: {path} not found.")
+        return False
+
+    conn = create_connection(db_file)
     if conn is None:
         print("Error: Could not create database connection.")
-        return
+        return False
 
     create_tables(conn)
 
+    from openpyxl import load_workbook
+    print(f"Importando {path}...")
+    origen = file_hash(path)
+    workbook = load_workbook(path, read_only=True, data_only=True)
     try:
-        # Migrate Servicios
-        print("Migrating Servicios...")
-        df = pd.read_excel(EXCEL_FILE, sheet_name='Servicios')
-        # Rename columns to match SQL (lowercase, underscores if needed) if necessary, 
-        # but pandas to_sql can handle it if we are careful. 
-        # Actually, let's just insert row by row or use to_sql with 'append'.
-        # We need to ensure column names map correctly.
-        # Excel columns: Sede, Fecha, Estilista, Servicio, Valor, Comision, Metodo_Pago
-        # Table columns: sede, fecha, estilista, servicio, valor, comision, metodo_pago
-        df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-        df.to_sql('servicios', conn, if_exists='append', index=False)
-        
-        # Migrate Productos
-        print("Migrating Productos...")
-        df = pd.read_excel(EXCEL_FILE, sheet_name='Productos')
-        df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-        df.to_sql('productos', conn, if_exists='append', index=False)
-
-        # Migrate Gastos
-        print("Migrating Gastos...")
-        df = pd.read_excel(EXCEL_FILE, sheet_name='Gastos')
-        df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-        df.to_sql('gastos', conn, if_exists='append', index=False)
-
-        # Migrate Inventario
-        print("Migrating Inventario...")
-        df = pd.read_excel(EXCEL_FILE, sheet_name='Inventario')
-        df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-        df.to_sql('inventario', conn, if_exists='append', index=False)
-
-        # Migrate Citas
-        print("Migrating Citas...")
-        try:
-            df = pd.read_excel(EXCEL_FILE, sheet_name='Citas')
-            df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-            # Ensure ID is unique, if excel has duplicates (it shouldn't) it might fail if PK constraint
-            df.to_sql('citas', conn, if_exists='append', index=False)
-        except Exception as e:
-            print(f"Error verifying Citas sheet: {e}")
-
-        # Migrate Gastos Mensuales
-        print("Migrating Gastos Mensuales...")
-        try:
-            df = pd.read_excel(EXCEL_FILE, sheet_name='GastosMensuales')
-            df.columns = [c.lower().replace(' ', '_') for c in df.columns]
-            df.to_sql('gastos_mensuales', conn, if_exists='append', index=False)
-        except Exception as e:
-            print(f"Error verifying GastosMensuales sheet: {e}")
-
+        for sheet, table, required in SHEETS:
+            if sheet not in workbook.sheetnames:
+                if required:
+                    print(f"  Aviso: la hoja {sheet} no existe.")
+                continue
+            print(f"Migrating {sheet}...")
+            import_sheet(conn, workbook, path, origen, sheet, table, chunk_size, default_sede)
         print("Migration completed successfully.")
-
+        return True
     except Exception as e:
+        # Committed chunks stay; the next run resumes from the checkpoint
+        conn.rollback()
         print(f"Error during migration: {e}")
+        return False
     finally:
-        if conn:
-            conn.close()
+        workbook.close()
+        conn.close()
 
 if __name__ == '__main__':
-    migrate_data()
+    parser = argparse.ArgumentParser(description='Importa libros de Excel a database.db (reanudable, sin duplicados).')
+    parser.add_argument('archivos', nargs='*', default=[EXCEL_FILE], help='archivos .xlsx (por defecto database.xlsx)')
+    parser.add_argument('--sede', help='sede para las filas que no la traen')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='filas por transacción')
+    parser.add_argument('--db', default=DB_FILE, help='base de datos de destino')
+    args = parser.parse_args()
+    for archivo in args.archivos:
+        migrate_data(archivo, args.db, args.chunk_size, args.sede)
@@ -0,0 +1,131 @@
+"""
+Background rendering and on-disk cache for PDF reports.
+
+xhtml2pdf takes seconds per document, so exports are rendered by a small worker
+pool instead of the request thread. Finished files are stored under a key
+derived from the template source and the data that goes into it: a closed day
+always maps to the same key, so later downloads are served straight from disk.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def content_key(template_source, context):
+    """Cache key for a rendered template: changes whenever the template or its data change."""
+    payload = json.dumps(context, sort_keys=True, default=str)
+    return hashlib.sha256((template_source + '\0' + payload).encode('utf-8')).hexdigest()
+
+
+class PdfExportQueue:
+    """Worker pool plus content-addressed cache of rendered PDFs."""
+
+    def __init__(self, cache_dir, workers=2, max_jobs=200, max_files=500):
+        self.cache_dir = cache_dir
+        self.max_jobs = max_jobs
+        self.max_files = max_files
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf-export')
+        self._jobs = {}
+        self._active = {}  # cache key -> job id still pending/running
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pdf')
+
+    def lookup(self, key):
+        """Path of the cached PDF for `key`, or None if it was never rendered."""
+        path = self.path_for(key)
+        return path if os.path.exists(path) else None
+
+    def store(self, key, pdf):
+        """Write a rendered PDF to the cache atomically and return its path."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+        self._prune_files()
+        return path
+
+    def submit(self, key, render, filename):
+        """Queue `render()` (returning PDF bytes or None) unless the result is cached or in progress."""
+        with self._lock:
+            if key in self._active:
+                return self._public(self._jobs[self._active[key]])
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'key': key,
+                'filename': filename,
+                'status': 'pending',
+                'error': None,
+                'created': time.time()
+            }
+            self._jobs[job['id']] = job
+            self._prune_jobs()
+
+            if self.lookup(key):
+                job['status'] = 'done'
+            else:
+                self._active[key] = job['id']
+                self._executor.submit(self._run, job, render)
+            return self._public(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def result_path(self, job_id):
+        """Cached file of a finished job (None while pending or on error)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if not job or job['status'] != 'done':
+            return None, None
+        return self.lookup(job['key']), job['filename']
+
+    def _run(self, job, render):
+        job['status'] = 'running'
+        try:
+            pdf = render()
+            if pdf is None:
+                raise RuntimeError('Error al generar el PDF')
+            self.store(job['key'], pdf)
+            job['status'] = 'done'
+        except Exception as e:
+            print(f"Error rendering PDF export {job['id']}: {e}")
+            job['status'] = 'error'
+            job['error'] = str(e)
+        finally:
+            with self._lock:
+                self._active.pop(job['key'], None)
+
+    @staticmethod
+    def _public(job):
+        return {k: job[k] for k in ('id', 'status', 'filename', 'error')}
+
+    def _prune_jobs(self):
+        # Forget the oldest finished jobs; their PDFs stay in the cache
+        finished = [j for j in self._jobs.values() if j['status'] in ('done', 'error')]
+        excess = len(self._jobs) - self.max_jobs
+        for job in sorted(finished, key=lambda j: j['created'])[:max(excess, 0)]:
+            del self._jobs[job['id']]
+
+    def _prune_files(self):
+        try:
+            entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith('.pdf')]
+        except OSError:
+            return
+        if len(entries) <= self.max_files:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_files]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,220 @@
+"""
+Slow-query log.
+
+TimedCursor (metrics.py) reports every finished statement to SlowQueryLog.record(),
+timed from execute() to its last fetched row. Statements are grouped by
+fingerprint: the SQL with literals replaced by ? and IN lists collapsed, so the
+same query with other values is one entry. The totals per fingerprint feed the
+admin view (GET /api/admin/slow-queries).
+
+Statements slower than the threshold are written to a rotating log file with
+their parameter shapes (types only; values such as client names and phones are
+never logged), the duration and their EXPLAIN QUERY PLAN, where full table
+scans show up as "SCAN <tabla>". The plan is taken on the first slow run of
+each fingerprint and reused, so repeated slow runs do not pay for it again.
+"""
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+MAX_FINGERPRINTS = 500
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+_COMMENT_RE = re.compile(r'--[^\n]*')
+
+# Statements EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalize_sql(sql):
+    """SQL on one line, without -- comments."""
+    return _SPACE_RE.sub(' ', _COMMENT_RE.sub('', sql)).strip()
+
+
+def fingerprint(sql):
+    """SQL without its literals: one entry per query shape, whatever the values."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _IN_LIST_RE.sub('IN (...)', normalize_sql(sql))
+
+
+def _type_name(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (bytes, memoryview)):
+        return 'blob'
+    return type(value).__name__
+
+
+def param_shape(parameters, many=False):
+    """Types of the bound parameters, e.g. '(str, str×3, float)'. Never the values."""
+    if many:
+        if isinstance(parameters, (list, tuple)):
+            first = param_shape(parameters[0]) if parameters else '()'
+            return f'{len(parameters)} × {first}'
+        return 'iterador'
+    if not parameters:
+        return '()'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {_type_name(value)}' for key, value in parameters.items()) + '}'
+    # Runs of the same type are collapsed (long IN lists)
+    runs = []
+    for value in parameters:
+        name = _type_name(value)
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return '(' + ', '.join(name if n == 1 else f'{name}×{n}' for name, n in runs) + ')'
+
+
+def explain(conn, sql, parameters=(), many=False):
+    """EXPLAIN QUERY PLAN of a statement as indented lines ([] if it has none)."""
+    if normalize_sql(sql).split(' ', 1)[0].upper() not in EXPLAINABLE:
+        return []
+    if many:
+        if not (isinstance(parameters, (list, tuple)) and parameters):
+            return []
+        parameters = parameters[0]
+    # A plain cursor: the EXPLAIN itself must not be traced
+    c = conn.cursor(sqlite3.Cursor)
+    try:
+        c.execute('EXPLAIN QUERY PLAN ' + sql, parameters or ())
+        rows = c.fetchall()
+    finally:
+        c.close()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _unused, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def full_scans(plan):
+    """Tables read completely according to a plan ('SCAN servicios', not '... USING INDEX')."""
+    tables = []
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith('SCAN ') and ' USING ' not in detail:
+            tables.append(detail.split()[1])
+    return tables
+
+
+class SlowQueryLog:
+    """Per-fingerprint statement statistics plus a rotating log of the slow ones."""
+
+    def __init__(self, path, threshold_ms=100, max_bytes=1024 * 1024, backups=5):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._fingerprints = {}
+        self._logger = None
+        self._logger_path = None
+
+    def _fingerprint(self, sql):
+        fp = self._fingerprints.get(sql)
+        if fp is None:
+            if len(self._fingerprints) > 4 * MAX_FINGERPRINTS:
+                self._fingerprints.clear()
+            fp = self._fingerprints[sql] = fingerprint(sql)
+        return fp
+
+    def _get_logger(self):
+        # Each instance writes to its own file; a new path (benchmarks) gets a new handler
+        with self._lock:
+            if self._logger is None or self._logger_path != self.path:
+                self._close_logger()
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                                               backupCount=self.backups, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                # Not registered with logging.getLogger(), so it is never shared
+                logger = logging.Logger('magical_hair.slow_queries', logging.INFO)
+                logger.addHandler(handler)
+                self._logger, self._logger_path = logger, self.path
+            return self._logger
+
+    def close(self):
+        """Close the log file (it is reopened by the next slow statement)."""
+        with self._lock:
+            self._close_logger()
+
+    def _close_logger(self):
+        if self._logger is not None:
+            for handler in self._logger.handlers:
+                handler.close()
+            self._logger = None
+
+    def record(self, cursor, sql, parameters, many, seconds):
+        """TimedCursor observer: account a finished statement; log it if slow."""
+        try:
+            fp = self._fingerprint(sql)
+            slow = seconds >= self.threshold
+            with self._lock:
+                stats = self._stats.get(fp)
+                if stats is None:
+                    if len(self._stats) >= MAX_FINGERPRINTS:
+                        # Forget the cheapest statement to stay bounded
+                        del self._stats[min(self._stats, key=lambda k: self._stats[k]['total'])]
+                    stats = self._stats[fp] = {'count': 0, 'slow': 0, 'total': 0.0, 'max': 0.0,
+                                               'params': '', 'plan': None, 'last_slow': None}
+                stats['count'] += 1
+                stats['total'] += seconds
+                stats['max'] = max(stats['max'], seconds)
+                plan = stats['plan']
+            if not slow:
+                return
+
+            shape = param_shape(parameters, many)
+            if plan is None:
+                # Once per fingerprint: the EXPLAIN runs on the caller's connection and thread
+                try:
+                    plan = explain(cursor.connection, sql, parameters, many)
+                except sqlite3.Error as e:
+                    plan = [f'(sin plan: {e})']
+            with self._lock:
+                stats['slow'] += 1
+                stats['params'] = shape
+                stats['plan'] = plan
+                stats['last_slow'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._get_logger().info('%.1f ms params=%s\n    %s\n%s', seconds * 1000, shape, normalize_sql(sql),
+                                    '\n'.join('    | ' + line for line in plan) or '    | (sin plan)')
+        except Exception as e:
+            print(f"Error registrando consulta lenta: {e}")
+
+    def top(self, n=20, sort='total'):
+        """The `n` fingerprints with the highest total, max or mean time."""
+        keys = {'total': lambda s: s['total'], 'max': lambda s: s['max'],
+                'mean': lambda s: s['total'] / s['count'], 'slow': lambda s: s['slow']}
+        if sort not in keys:
+            raise ValueError(f"Orden no válido: {sort}")
+        with self._lock:
+            items = [(fp, dict(stats)) for fp, stats in self._stats.items()]
+        items.sort(key=lambda item: keys[sort](item[1]), reverse=True)
+        return [{
+            'sql': fp,
+            'count': stats['count'],
+            'slow': stats['slow'],
+            'total_ms': round(stats['total'] * 1000, 2),
+            'mean_ms': round(stats['total'] * 1000 / stats['count'], 3),
+            'max_ms': round(stats['max'] * 1000, 2),
+            'params': stats['params'],
+            'plan': stats['plan'],
+            'full_scans': full_scans(stats['plan'] or []),
+            'last_slow': stats['last_slow'],
+        } for fp, stats in items[:n]]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
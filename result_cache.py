@@ -0,0 +1,89 @@
+"""
+Per-sede data versions and an LRU cache for analytics results.
+
+Every INSERT/UPDATE/DELETE on the business tables bumps the sede's counter in
+data_versions (via triggers, so every write path is covered). Results cached
+under a key that includes that counter are served from memory until the next
+write for the sede makes the key unreachable.
+"""
+import threading
+from collections import OrderedDict
+
+DATA_VERSION_TABLES = ('servicios', 'productos', 'gastos', 'inventario', 'citas', 'gastos_mensuales')
+
+DATA_VERSIONS_SCHEMA = '''CREATE TABLE IF NOT EXISTS data_versions (
+                    sede TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                );'''
+
+
+def _bump_sql(ref):
+    return f'''INSERT INTO data_versions (sede, version) VALUES (IFNULL({ref}.sede, ''), 1)
+                ON CONFLICT (sede) DO UPDATE SET version = version + 1;'''
+
+
+def create_data_version_schema(conn):
+    c = conn.cursor()
+    c.execute(DATA_VERSIONS_SCHEMA)
+    for table in DATA_VERSION_TABLES:
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_data_version_insert AFTER INSERT ON {table}
+            BEGIN
+                {_bump_sql('NEW')}
+            END;''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_data_version_delete AFTER DELETE ON {table}
+            BEGIN
+                {_bump_sql('OLD')}
+            END;''')
+        # An update can move a row between sedes: both of them change
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_data_version_update AFTER UPDATE ON {table}
+            BEGIN
+                {_bump_sql('OLD')}
+                {_bump_sql('NEW')}
+            END;''')
+    conn.commit()
+
+
+def data_version(conn, sede):
+    """Write counter of a sede (0 if nothing was ever written for it)."""
+    c = conn.cursor()
+    c.execute('SELECT version FROM data_versions WHERE sede = ?', (sede or '',))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+def total_data_version(conn):
+    """Counter that changes with any write, whatever the sede (sum of all of them)."""
+    c = conn.cursor()
+    c.execute('SELECT IFNULL(SUM(version), 0) FROM data_versions')
+    return c.fetchone()[0]
+
+
+class ResultCache:
+    """Thread-safe LRU mapping of keys to computed results."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
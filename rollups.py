@@ -0,0 +1,225 @@
+"""
+Daily aggregate tables for Magical Hair.
+
+`daily_totals` keeps one pre-summed row per (sede, dia, estilista, metodo_pago).
+It is maintained by triggers on servicios, productos and gastos, so every write
+path (registro de ventas, resumen del día, panel admin) keeps it up to date
+inside the same transaction. Expenses have no stylist or payment method and are
+stored with estilista = '' and metodo_pago = ''.
+
+Run this file directly to rebuild the table from the historical data:
+    python rollups.py
+"""
+
+# Columns of daily_totals fed by each source table:
+# (valor column, comision column, counter column)
+ROLLUP_SOURCES = {
+    'servicios': ('ventas_servicios', 'comision_servicios', 'num_servicios'),
+    'productos': ('ventas_productos', 'comision_productos', 'num_productos'),
+    'gastos':    ('gastos', None, 'num_gastos'),
+}
+
+DAILY_TOTALS_SCHEMA = '''CREATE TABLE IF NOT EXISTS daily_totals (
+                    sede TEXT NOT NULL,
+                    dia TEXT NOT NULL,
+                    estilista TEXT NOT NULL,
+                    metodo_pago TEXT NOT NULL,
+                    ventas_servicios REAL NOT NULL DEFAULT 0,
+                    comision_servicios REAL NOT NULL DEFAULT 0,
+                    num_servicios INTEGER NOT NULL DEFAULT 0,
+                    ventas_productos REAL NOT NULL DEFAULT 0,
+                    comision_productos REAL NOT NULL DEFAULT 0,
+                    num_productos INTEGER NOT NULL DEFAULT 0,
+                    gastos REAL NOT NULL DEFAULT 0,
+                    num_gastos INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (sede, dia, estilista, metodo_pago)
+                ) WITHOUT ROWID;'''
+
+
+def _key_exprs(table, ref):
+    """SQL expressions for the rollup key of a NEW/OLD row of `table`."""
+    if table == 'gastos':
+        return f"IFNULL({ref}.sede, '')", f"date({ref}.fecha)", "''", "''"
+    return (f"IFNULL({ref}.sede, '')", f"date({ref}.fecha)",
+            f"IFNULL({ref}.estilista, '')", f"IFNULL({ref}.metodo_pago, '')")
+
+
+def _apply_sql(table, ref, sign):
+    """Statement adding (sign=+1) or removing (sign=-1) one row's contribution."""
+    valor_col, comision_col, count_col = ROLLUP_SOURCES[table]
+    sede, dia, estilista, metodo = _key_exprs(table, ref)
+
+    columns = [valor_col, count_col]
+    values = [f"{sign} * IFNULL({ref}.valor, 0)", str(sign)]
+    if comision_col:
+        columns.append(comision_col)
+        values.append(f"{sign} * IFNULL({ref}.comision, 0)")
+
+    updates = ', '.join(f"{col} = {col} + excluded.{col}" for col in columns)
+    return f'''INSERT INTO daily_totals (sede, dia, estilista, metodo_pago, {', '.join(columns)})
+            VALUES ({sede}, {dia}, {estilista}, {metodo}, {', '.join(values)})
+            ON CONFLICT (sede, dia, estilista, metodo_pago) DO UPDATE SET {updates};'''
+
+
+def _cleanup_sql(table, ref):
+    """Statement dropping a rollup row once nothing contributes to it anymore."""
+    sede, dia, estilista, metodo = _key_exprs(table, ref)
+    return f'''DELETE FROM daily_totals
+            WHERE sede = {sede} AND dia = {dia} AND estilista = {estilista} AND metodo_pago = {metodo}
+              AND num_servicios = 0 AND num_productos = 0 AND num_gastos = 0;'''
+
+
+def _trigger_statements(table):
+    yield f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_insert AFTER INSERT ON {table}
+        WHEN date(NEW.fecha) IS NOT NULL
+        BEGIN
+            {_apply_sql(table, 'NEW', 1)}
+        END;'''
+    yield f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_delete AFTER DELETE ON {table}
+        WHEN date(OLD.fecha) IS NOT NULL
+        BEGIN
+            {_apply_sql(table, 'OLD', -1)}
+            {_cleanup_sql(table, 'OLD')}
+        END;'''
+    # An update may move the row to another key, so remove the old contribution
+    # and add the new one
+    yield f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_update_old AFTER UPDATE ON {table}
+        WHEN date(OLD.fecha) IS NOT NULL
+        BEGIN
+            {_apply_sql(table, 'OLD', -1)}
+            {_cleanup_sql(table, 'OLD')}
+        END;'''
+    yield f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_update_new AFTER UPDATE ON {table}
+        WHEN date(NEW.fecha) IS NOT NULL
+        BEGIN
+            {_apply_sql(table, 'NEW', 1)}
+        END;'''
+
+
+def create_rollup_schema(conn):
+    """Create daily_totals and its triggers. Backfills the table the first time."""
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_totals'")
+    is_new = c.fetchone() is None
+
+    c.execute(DAILY_TOTALS_SCHEMA)
+    for table in ROLLUP_SOURCES:
+        for statement in _trigger_statements(table):
+            c.execute(statement)
+    conn.commit()
+
+    if is_new:
+        rebuild_daily_totals(conn)
+
+
+def rebuild_daily_totals(conn):
+    """Recompute daily_totals from scratch in one transaction."""
+    c = conn.cursor()
+    c.execute('DELETE FROM daily_totals')
+    for table, (valor_col, comision_col, count_col) in ROLLUP_SOURCES.items():
+        sede, dia, estilista, metodo = _key_exprs(table, table)
+        columns = [valor_col, count_col]
+        values = ['SUM(IFNULL(valor, 0))', 'COUNT(*)']
+        if comision_col:
+            columns.append(comision_col)
+            values.append('SUM(IFNULL(comision, 0))')
+        updates = ', '.join(f"{col} = {col} + excluded.{col}" for col in columns)
+        c.execute(f'''INSERT INTO daily_totals (sede, dia, estilista, metodo_pago, {', '.join(columns)})
+                      SELECT {sede}, {dia}, {estilista}, {metodo}, {', '.join(values)}
+                      FROM {table}
+                      WHERE date(fecha) IS NOT NULL
+                      GROUP BY 1, 2, 3, 4
+                      ON CONFLICT (sede, dia, estilista, metodo_pago) DO UPDATE SET {updates}''')
+    conn.commit()
+    c.execute('SELECT COUNT(*) FROM daily_totals')
+    return c.fetchone()[0]
+
+
+def month_bounds(month):
+    """Return the half-open day range ['YYYY-MM-01', first day of next month)."""
+    year, mon = (int(part) for part in month.split('-'))
+    if mon == 12:
+        return f'{year:04d}-12-01', f'{year + 1:04d}-01-01'
+    return f'{year:04d}-{mon:02d}-01', f'{year:04d}-{mon + 1:02d}-01'
+
+
+def _sede_clause(sede):
+    return (' AND sede = ?', [sede]) if sede else ('', [])
+
+
+def month_totals(conn, month, sede=None):
+    """Sales, commissions and expenses for a month ('YYYY-MM'), optionally per sede."""
+    start, end = month_bounds(month)
+    sede_sql, sede_params = _sede_clause(sede)
+    c = conn.cursor()
+    c.execute(f'''SELECT IFNULL(SUM(ventas_servicios + ventas_productos), 0),
+                         IFNULL(SUM(comision_servicios + comision_productos), 0),
+                         IFNULL(SUM(gastos), 0)
+                  FROM daily_totals
+                  WHERE dia >= ? AND dia < ?{sede_sql}''', [start, end] + sede_params)
+    ventas, nomina, gastos = c.fetchone()
+    return {'ventas': ventas, 'nomina': nomina, 'gastos': gastos}
+
+
+def month_by_stylist(conn, month, sede=None):
+    """Per-stylist sales and commissions for a month: {estilista: (ventas, nomina)}."""
+    start, end = month_bounds(month)
+    sede_sql, sede_params = _sede_clause(sede)
+    c = conn.cursor()
+    c.execute(f'''SELECT estilista,
+                         SUM(ventas_servicios + ventas_productos),
+                         SUM(comision_servicios + comision_productos)
+                  FROM daily_totals
+                  WHERE dia >= ? AND dia < ?{sede_sql}
+                    AND estilista != '' AND num_servicios + num_productos > 0
+                  GROUP BY estilista''', [start, end] + sede_params)
+    return {row[0]: (row[1], row[2]) for row in c.fetchall()}
+
+
+def sales_timeline(conn, last_year, years=3, sede=None):
+    """Year x month sales matrix ending at `last_year`: {'YYYY': [ventas enero..diciembre]}.
+
+    A single GROUP BY over daily_totals feeds the whole matrix, so charting
+    more years only widens the range scanned, not the number of passes.
+    """
+    first_year = last_year - years + 1
+    timeline = {str(y): [0.0] * 12 for y in range(first_year, last_year + 1)}
+
+    sede_sql, sede_params = _sede_clause(sede)
+    c = conn.cursor()
+    c.execute(f'''SELECT CAST(substr(dia, 1, 4) AS INTEGER), CAST(substr(dia, 6, 2) AS INTEGER),
+                         SUM(ventas_servicios + ventas_productos)
+                  FROM daily_totals
+                  WHERE dia >= ? AND dia < ?{sede_sql}
+                  GROUP BY substr(dia, 1, 7)''',
+              [f'{first_year:04d}-01-01', f'{last_year + 1:04d}-01-01'] + sede_params)
+    for year, month, ventas in c.fetchall():
+        timeline[str(year)][month - 1] = float(ventas)
+    return timeline
+
+
+def sales_by_day(conn, start, end, sede=None):
+    """Sales per day in [start, end): [(dia, day_index 0=lunes, ISO week, ventas)].
+
+    Weekday and ISO week are computed by SQLite; only days with sales are returned.
+    """
+    sede_sql, sede_params = _sede_clause(sede)
+    c = conn.cursor()
+    c.execute(f'''SELECT dia,
+                         (CAST(strftime('%w', dia) AS INTEGER) + 6) % 7,
+                         (CAST(strftime('%j', date(dia, '-3 days', 'weekday 4')) AS INTEGER) - 1) / 7 + 1,
+                         SUM(ventas_servicios + ventas_productos)
+                  FROM daily_totals
+                  WHERE dia >= ? AND dia < ?{sede_sql}
+                  GROUP BY dia
+                  HAVING SUM(num_servicios + num_productos) > 0
+                  ORDER BY dia''', [start, end] + sede_params)
+    return c.fetchall()
+
+if __name__ == '__main__':
+    from app import get_db_connection, init_db
+    init_db()
+    conn = get_db_connection()
+    rows = rebuild_daily_totals(conn)
+    conn.close()
+    print(f"daily_totals reconstruida: {rows} filas.")
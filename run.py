@@ -1,8 +1,46 @@
 import os
 import sys
+import time
 import webbrowser
 from threading import Timer
-from app import app, init_db
+
+# python run.py --profile-startup: report what importing the app costs and exit
+PROFILE_STARTUP = '--profile-startup' in sys.argv
+
+def install_import_timer():
+    """Time every first import from now on. Returns {module: seconds (including its own imports)}."""
+    import builtins
+    original_import = builtins.__import__
+    timings = {}
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            timings.setdefault(name, time.perf_counter() - start)
+
+    builtins.__import__ = timed_import
+    return timings
+
+if PROFILE_STARTUP:
+    import_timings = install_import_timer()
+startup_begin = time.perf_counter()
+from app import app, init_db, start_background_warmup, HEAVY_MODULES
+app_import_seconds = time.perf_counter() - startup_begin
+
+def print_startup_profile(init_db_seconds, top=15):
+    print("\n── Startup profile ──")
+    print(f"import app: {app_import_seconds * 1000:.0f} ms")
+    print(f"init_db():  {init_db_seconds * 1000:.0f} ms")
+    print("Slowest imports (cumulative):")
+    for name, seconds in sorted(import_timings.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+    loaded = [m for m in HEAVY_MODULES + ('pandas',) if m in sys.modules]
+    # Anything listed here is paid for on every cold start
+    print(f"Heavy modules loaded at startup: {', '.join(loaded) if loaded else 'none'}")
 
 def open_browser():
     webbrowser.open_new("http://127.0.0.1:5000")
@@ -35,7 +73,12 @@ if __name__ == '__main__':
 
         # Inicializar base de datos
         print("Initializing database...")
+        init_db_begin = time.perf_counter()
         init_db()
+        if PROFILE_STARTUP:
+            print_startup_profile(time.perf_counter() - init_db_begin)
+            sys.exit(0)
+        start_background_warmup()
 
         # Abrir navegador después de 1.5 segundos
         print("Starting browser...")
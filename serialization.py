@@ -0,0 +1,61 @@
+"""
+JSON-ready rows straight from sqlite3 cursors.
+
+The list endpoints used to build a pandas DataFrame only to call fillna() and
+to_dict(orient='records'); for the usual page of a few dozen rows that cost
+more than the query. These helpers read the cursor directly. `null` is the
+value NULL columns become: None (JSON null) for the admin panel, '' for the
+screens that expect empty strings.
+"""
+import json
+
+
+def column_names(cursor):
+    return [column[0] for column in cursor.description]
+
+
+def row_to_dict(row, columns, null=None):
+    return {col: (null if value is None else value) for col, value in zip(columns, row)}
+
+
+def rows_to_dicts(cursor, null=None):
+    """All remaining rows of `cursor` as a list of dicts."""
+    columns = column_names(cursor)
+    return [row_to_dict(row, columns, null) for row in cursor]
+
+
+def iter_json_rows(cursor, envelope, null=None, chunk_size=500, max_rows=None, trailer=None):
+    """Stream {**envelope, "columns": [...], "data": [rows]} as JSON text chunks.
+
+    Rows are fetched `chunk_size` at a time, so memory stays flat however many
+    rows the query returns. With `max_rows`, one extra row may be read to tell
+    whether more exist; `trailer(first_row, last_row, has_more)` can then add
+    keys after "data" (e.g. pagination cursors).
+    """
+    columns = column_names(cursor)
+    head = json.dumps(dict(envelope, columns=columns))
+    yield head[:-1] + ', "data": ['
+
+    sent = 0
+    first_row = last_row = None
+    has_more = False
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        if max_rows is not None and sent + len(rows) > max_rows:
+            rows = rows[:max_rows - sent]
+            has_more = True
+        if rows:
+            dicts = [row_to_dict(row, columns, null) for row in rows]
+            chunk = ', '.join(json.dumps(d, default=str) for d in dicts)
+            yield chunk if sent == 0 else ', ' + chunk
+            if first_row is None:
+                first_row = dicts[0]
+            last_row = dicts[-1]
+            sent += len(rows)
+        if has_more:
+            break
+
+    extra = trailer(first_row, last_row, has_more) if trailer else {}
+    yield ']' + ''.join(f', {json.dumps(key)}: {json.dumps(value, default=str)}' for key, value in extra.items()) + '}'
@@ -212,7 +212,47 @@ function downloadPDF() {
         selectedDate = new Date().toISOString().split('T')[0];
     }
 
-    window.location.href = `/export_pdf?date=${selectedDate}&sede=${sede}`;
+    exportPdfJob(selectedDate, sede);
+}
+
+// The PDF is rendered in the background; poll the job and download when ready
+async function exportPdfJob(date, sede) {
+    try {
+        const response = await fetch('/api/export_pdf/jobs', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ date: date, sede: sede })
+        });
+        const result = await response.json();
+        if (result.status !== 'success') {
+            showNotification(result.message || 'Error al generar el PDF', true);
+            return;
+        }
+
+        let job = result.job;
+        if (job.status !== 'done') {
+            showNotification('Generando PDF...');
+        }
+        while (job.status === 'pending' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const statusResponse = await fetch(`/api/export_pdf/jobs/${job.id}`);
+            const statusResult = await statusResponse.json();
+            if (statusResult.status !== 'success') {
+                showNotification(statusResult.message || 'Error al generar el PDF', true);
+                return;
+            }
+            job = statusResult.job;
+        }
+
+        if (job.status === 'done') {
+            window.location.href = `/export_pdf/jobs/${job.id}/download`;
+        } else {
+            showNotification(job.error || 'Error al generar el PDF', true);
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showNotification('Error de conexión', true);
+    }
 }
 
 function showNotification(message, isError = false) {
@@ -485,10 +525,46 @@ async function updateServiceValue(name, value) {
     }
 }
 
+async function updateServiceCategory(name, category) {
+    try {
+        const response = await fetch('/api/service-category', {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ name: name, category: category }),
+        });
+
+        const result = await response.json();
+
+        if (result.status === 'success') {
+            showNotification('Categoría del servicio actualizada');
+        } else {
+            showNotification(result.message, true);
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showNotification('Error de conexión', true);
+    }
+}
+
+// Demand categories, loaded once from the server (catalogs.SERVICE_CATEGORIES)
+let serviceCategories = null;
+
+async function getServiceCategoryNames() {
+    if (!serviceCategories) {
+        const response = await fetch('/api/service-categories');
+        const result = await response.json();
+        serviceCategories = result.status === 'success' ? result.categories : [];
+    }
+    return serviceCategories;
+}
+
 async function loadServicesList() {
     try {
         const response = await fetch('/api/services');
         const result = await response.json();
+        const categories = await getServiceCategoryNames();
 
         if (result.status === 'success') {
             const list = document.getElementById('servicesList');
@@ -511,6 +587,13 @@ async function loadServicesList() {
                                 onchange="updateServiceValue('${service.name}', this.value)">
                             <span style="font-size: 0.85rem;">$</span>
                         </div>
+                        <div style="display: flex; align-items: center; gap: 10px;">
+                            <label style="font-size: 0.85rem; color: #666;">Categoría:</label>
+                            <select style="padding: 4px 8px; border: 1px solid #ddd; border-radius: 4px;"
+                                onchange="updateServiceCategory('${service.name}', this.value)">
+                                ${categories.map(cat => `<option value="${cat}" ${cat === service.category ? 'selected' : ''}>${cat}</option>`).join('')}
+                            </select>
+                        </div>
                     </div>
                 `;
                 list.appendChild(li);